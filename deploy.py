@@ -1,13 +1,21 @@
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 import sagemaker
 from sagemaker.sklearn import SKLearnModel
+from sagemaker.serverless import ServerlessInferenceConfig
 import os
+import argparse
+import io
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import joblib
+import numpy as np
 import tarfile
-import shutil
+
+from deploy_lambda_api import LambdaAPIDeployment
 
 try:
     from config import load_config
@@ -20,63 +28,176 @@ except ImportError:
         'AWS_REGION': os.environ.get('AWS_REGION', 'eu-west-3')
     }
 
+# Client S3 AWS CRT (optionnel, pip install 'boto3[crt]')
+try:
+    import awscrt  # noqa: F401
+    from s3transfer.crt import (
+        BotocoreCRTCredentialsWrapper,
+        BotocoreCRTRequestSerializer,
+        CRTTransferManager,
+        create_s3_crt_client
+    )
+    CRT_AVAILABLE = True
+except ImportError:
+    CRT_AVAILABLE = False
+
+# Connexions HTTPS persistantes pour les appels sagemaker-runtime
+RUNTIME_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={'mode': 'adaptive', 'max_attempts': 3},
+    connect_timeout=2,
+    read_timeout=10
+)
+
+# ml.t2.medium : 2 vCPU burstables partagés. Un BLAS multi-thread y surcharge les
+# cœurs (changements de contexte plus coûteux que le gain sur un petit MLP) :
+# un seul thread par worker. Sur une instance dédiée (ml.c6i.large), ces
+# variables peuvent être retirées pour laisser le BLAS utiliser tous les cœurs.
+INFERENCE_ENV = {
+    'OMP_NUM_THREADS': '1',
+    'MKL_NUM_THREADS': '1',
+    'OPENBLAS_NUM_THREADS': '1'
+}
+
+# SageMaker exige un model.tar.gz (gzip obligatoire). Les poids float32 sont quasi
+# incompressibles : le niveau 1 donne presque la même taille que le niveau 9 par
+# défaut de tarfile pour une fraction du temps CPU.
+MODEL_ARCHIVE_COMPRESSLEVEL = 1
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+# Upload multipart parallèle : plusieurs connexions TCP pour saturer le lien
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * MB,
+    multipart_chunksize=16 * MB,
+    max_concurrency=10,
+    use_threads=True
+)
+
+# Archives > 1 Go : parts plus grandes, concurrence réduite (part_size * concurrency ≈ RAM)
+S3_LARGE_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * MB,
+    multipart_chunksize=128 * MB,
+    max_concurrency=8,
+    use_threads=True
+)
 
 
 class OptimizedCompatibleDeployment:
-    def __init__(self, region='eu-west-3'):
+    def __init__(self, region='eu-west-3', serverless=False, memory_size_in_mb=2048, max_concurrency=10):
         self.region = region
+        # Endpoint serverless : facturé à l'invocation, aucun coût au repos
+        self.serverless = serverless
+        self.memory_size_in_mb = memory_size_in_mb
+        self.max_concurrency = max_concurrency
         self.session = sagemaker.Session(boto3.Session(region_name=region))
         self.role_arn = config['SAGEMAKER_ROLE_ARN']
         self.bucket_name =  config['S3_BUCKET_NAME'] 
+        self._runtime = boto3.client('sagemaker-runtime', region_name=region, config=RUNTIME_CONFIG)
         
     def prepare_optimized_model(self):
         print("Préparation du modèle MLPClassifier optimisé...")
         
         # Vérifier que le modèle optimisé existe
-        model_file = 'models/MLPClassifier_optimized.pkl'
+        model_file = 'models/bundle.tar.gz'
         if not os.path.exists(model_file):
             print("Modèle optimisé non trouvé. Exécutez d'abord train_model.py")
             return None
         
-        # Créer le dossier du modèle
-        model_dir = 'optimized_compatible_package'
-        if os.path.exists(model_dir):
-            shutil.rmtree(model_dir)
-        os.makedirs(model_dir)
-        
-        # Copier tous les fichiers nécessaires
-        files_to_copy = [
-            ('models/MLPClassifier_optimized.pkl', 'MLPClassifier_optimized.pkl'),
-            ('models/scaler_optimized.pkl', 'scaler_optimized.pkl'),
-            ('models/selected_features_optimized.pkl', 'selected_features_optimized.pkl'),
-            ('inference.py', 'inference.py')
-        ]
-        
-        for src, dst in files_to_copy:
-            if os.path.exists(src):
-                shutil.copy2(src, os.path.join(model_dir, dst))
-                print(f"Copié: {src} -> {dst}")
-            else:
-                print(f"Fichier manquant: {src}")
-                return None
+        if not os.path.exists('inference.py'):
+            print("Fichier manquant: inference.py")
+            return None
+        
+        # Le scaler est déjà fusionné dans le modèle par train_model.py
+        model = self.build_inference_model(model_file)
+        if model is None:
+            return None
+        
+        # L'inférence n'a besoin que du nombre de features, pas de leurs noms
+        bundle = {
+            'model': model,
+            'n_features': model.coefs_[0].shape[0]
+        }
         
-        # Créer l'archive
+        # Créer l'archive directement depuis les sources (pas de dossier intermédiaire)
         model_tar = 'optimized_compatible_model.tar.gz'
-        with tarfile.open(model_tar, 'w:gz') as tar:
-            tar.add(model_dir, arcname='.')
+        with tarfile.open(model_tar, 'w:gz', compresslevel=MODEL_ARCHIVE_COMPRESSLEVEL) as tar:
+            self.add_joblib_to_tar(tar, bundle, 'bundle.joblib')
+            print(f"Ajouté: {model_file}:model.pkl -> bundle.joblib (scaler fusionné, poids float32)")
+            
+            tar.add('inference.py', arcname='inference.py')
+            print("Ajouté: inference.py -> inference.py")
         
-        shutil.rmtree(model_dir)
         print(f"Modèle optimisé préparé: {model_tar}")
         return model_tar
     
+    def build_inference_model(self, model_file):
+        """Charge le modèle de l'archive d'entraînement (scaler déjà fusionné) avec des poids float32 contigus"""
+        with tarfile.open(model_file, 'r:gz') as tar:
+            model = joblib.load(tar.extractfile('model.pkl'))
+        if not getattr(model, 'scaler_fused_', False):
+            print("Modèle sans scaler fusionné (ancien format). Réexécutez train_model.py")
+            return None
+        
+        # Sans effet sur un modèle issu de train_model.py (déjà float32 contigu)
+        model.coefs_ = [np.ascontiguousarray(w, dtype=np.float32) for w in model.coefs_]
+        model.intercepts_ = [np.ascontiguousarray(b, dtype=np.float32) for b in model.intercepts_]
+        return model
+    
+    def add_joblib_to_tar(self, tar, obj, arcname):
+        """Sérialise un objet avec joblib directement dans l'archive"""
+        # Pas de compression joblib : elle empêcherait le mmap au chargement
+        buffer = io.BytesIO()
+        joblib.dump(obj, buffer)
+        
+        info = tarfile.TarInfo(arcname)
+        info.size = buffer.tell()
+        info.mtime = time.time()
+        buffer.seek(0)
+        tar.addfile(info, buffer)
+    
+    def upload_with_crt(self, model_tar, s3_key):
+        """Upload via le client S3 AWS CRT (implémentation C, débit auto-ajusté)"""
+        boto_session = boto3.Session(region_name=self.region)
+        credentials = BotocoreCRTCredentialsWrapper(boto_session.get_credentials())
+        crt_s3_client = create_s3_crt_client(
+            self.region,
+            crt_credentials_provider=credentials.to_crt_credentials_provider()
+        )
+        serializer = BotocoreCRTRequestSerializer(
+            boto_session._session,
+            client_kwargs={'region_name': self.region}
+        )
+        
+        with CRTTransferManager(crt_s3_client, serializer) as transfer_manager:
+            transfer_manager.upload(model_tar, self.bucket_name, s3_key).result()
+    
     def upload_model_to_s3(self, model_tar):
         print("Téléchargement du modèle vers S3...")
         
         s3_key = f"models/{model_tar}"
+        
+        if CRT_AVAILABLE:
+            try:
+                self.upload_with_crt(model_tar, s3_key)
+                s3_uri = f"s3://{self.bucket_name}/{s3_key}"
+                print(f"Modèle téléchargé (CRT): {s3_uri}")
+                return s3_uri
+            except Exception as e:
+                print(f"Upload CRT échoué, repli sur boto3: {str(e)}")
+        
         s3_client = boto3.client('s3', region_name=self.region)
         
+        # Choisir la configuration de transfert selon la taille de l'archive
+        if os.path.getsize(model_tar) > GB:
+            transfer_config = S3_LARGE_TRANSFER_CONFIG
+        else:
+            transfer_config = S3_TRANSFER_CONFIG
+        
         try:
-            s3_client.upload_file(model_tar, self.bucket_name, s3_key)
+            s3_client.upload_file(model_tar, self.bucket_name, s3_key, Config=transfer_config)
             s3_uri = f"s3://{self.bucket_name}/{s3_key}"
             print(f"Modèle téléchargé: {s3_uri}")
             return s3_uri
@@ -84,48 +205,78 @@ class OptimizedCompatibleDeployment:
             print(f"Erreur lors du téléchargement: {str(e)}")
             return None
     
-    def deploy_model(self, model_s3_uri):
-        print("Déploiement du modèle optimisé sur SageMaker...")
+    def create_model(self, model_s3_uri):
+        """Crée l'objet modèle SageMaker (aucun appel réseau)"""
+        model_name = f"bankruptcy-model-optimized-compatible-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
         
-        try:
-            # Créer le modèle SageMaker
-            model_name = f"bankruptcy-model-optimized-compatible-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-            
-            sklearn_model = SKLearnModel(
-                model_data=model_s3_uri,
-                role=self.role_arn,
-                entry_point='inference.py',
-                framework_version='1.0-1',
-                py_version='py3',
-                sagemaker_session=self.session,
-                name=model_name
+        return SKLearnModel(
+            model_data=model_s3_uri,
+            role=self.role_arn,
+            entry_point='inference.py',
+            framework_version='1.0-1',
+            py_version='py3',
+            sagemaker_session=self.session,
+            name=model_name,
+            env=INFERENCE_ENV
+        )
+    
+    def create_endpoint(self, sklearn_model, wait=True):
+        """Crée l'endpoint ; avec wait=False, rend la main dès que la création est lancée"""
+        endpoint_name = f"bankruptcy-predictor-optimized-compatible-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        
+        if self.serverless:
+            predictor = sklearn_model.deploy(
+                serverless_inference_config=ServerlessInferenceConfig(
+                    memory_size_in_mb=self.memory_size_in_mb,
+                    max_concurrency=self.max_concurrency
+                ),
+                endpoint_name=endpoint_name,
+                wait=wait
             )
-            
-            # Déployer le endpoint
-            endpoint_name = f"bankruptcy-predictor-optimized-compatible-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-            
+        else:
             predictor = sklearn_model.deploy(
                 initial_instance_count=1,
                 instance_type='ml.t2.medium',
-                endpoint_name=endpoint_name
+                endpoint_name=endpoint_name,
+                wait=wait
             )
+        
+        return endpoint_name, predictor
+    
+    def wait_for_endpoint(self, endpoint_name):
+        """Attend que l'endpoint soit InService"""
+        waiter = self.session.sagemaker_client.get_waiter('endpoint_in_service')
+        waiter.wait(EndpointName=endpoint_name)
+    
+    def deploy_model(self, model_s3_uri, wait=True):
+        print("Déploiement du modèle optimisé sur SageMaker...")
+        
+        try:
+            # Créer le modèle SageMaker
+            sklearn_model = self.create_model(model_s3_uri)
             
-            print(f"Modèle optimisé déployé: {endpoint_name}")
+            # Déployer le endpoint
+            endpoint_name, predictor = self.create_endpoint(sklearn_model, wait=wait)
+            
+            if wait:
+                print(f"Modèle optimisé déployé: {endpoint_name}")
+            else:
+                print(f"Création de l'endpoint lancée: {endpoint_name}")
             return endpoint_name, predictor
             
         except Exception as e:
             print(f"Erreur lors du déploiement: {str(e)}")
             return None, None
     
-    def test_deployed_model(self, endpoint_name):
+    def test_deployed_model(self, endpoint_name, runtime=None):
         print("Test du modèle optimisé déployé...")
         
         try:
-            # Créer un client SageMaker Runtime
-            runtime = boto3.client('sagemaker-runtime', region_name=self.region)
+            # Réutiliser le client fourni, sinon celui de l'instance
+            if runtime is None:
+                runtime = self._runtime
             
             # Données de test (50 features)
-            import numpy as np
             test_data = list(np.random.randn(50))
             
             # Faire la prédiction
@@ -136,7 +287,7 @@ class OptimizedCompatibleDeployment:
             )
             
             # Lire la réponse
-            result = json.loads(response['Body'].read().decode())
+            result = json.loads(response['Body'].read())
             print("Test réussi!")
             print(f"Résultat: {json.dumps(result, indent=2)}")
             return True
@@ -162,11 +313,20 @@ class OptimizedCompatibleDeployment:
             if not model_s3_uri:
                 return None
             
-            # 3. Déployer
-            endpoint_name, predictor = self.deploy_model(model_s3_uri)
+            # 3. Lancer la création de l'endpoint sans attendre
+            endpoint_name, predictor = self.deploy_model(model_s3_uri, wait=False)
             if not endpoint_name:
                 return None
             
+            # Pendant le provisionnement de l'instance (plusieurs minutes),
+            # préparer le package Lambda réutilisé par deploy_lambda_api.py
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                lambda_package = executor.submit(LambdaAPIDeployment(region=self.region).create_lambda_package)
+                print("Attente de la disponibilité de l'endpoint...")
+                self.wait_for_endpoint(endpoint_name)
+                lambda_package.result()
+            print(f"Modèle optimisé déployé: {endpoint_name}")
+            
             # 4. Tester
             if self.test_deployed_model(endpoint_name):
                 print("Test du modèle réussi!")
@@ -180,7 +340,10 @@ class OptimizedCompatibleDeployment:
             print(f"Modèle: MLPClassifier finetuné")
             print(f"Features: 50 (sélectionnées)")
             print(f"Région: {self.region}")
-            print(f"Instance: ml.t2.medium")
+            if self.serverless:
+                print(f"Serverless: {self.memory_size_in_mb} Mo, concurrence max {self.max_concurrency}")
+            else:
+                print(f"Instance: ml.t2.medium")
             
             return endpoint_name
             
@@ -191,7 +354,21 @@ class OptimizedCompatibleDeployment:
             return None
 
 def main():
-    deployer = OptimizedCompatibleDeployment()
+    parser = argparse.ArgumentParser(description='Déploiement du modèle sur SageMaker')
+    parser.add_argument('--serverless', action='store_true',
+                       help='Déployer un endpoint serverless au lieu d\'une instance ml.t2.medium')
+    parser.add_argument('--memory-size', type=int, default=2048,
+                       help='Mémoire de l\'endpoint serverless en Mo (défaut: 2048)')
+    parser.add_argument('--max-concurrency', type=int, default=10,
+                       help='Concurrence maximale de l\'endpoint serverless (défaut: 10)')
+    
+    args = parser.parse_args()
+    
+    deployer = OptimizedCompatibleDeployment(
+        serverless=args.serverless,
+        memory_size_in_mb=args.memory_size,
+        max_concurrency=args.max_concurrency
+    )
     endpoint_name = deployer.run_optimized_deployment()
 
 if __name__ == "__main__":
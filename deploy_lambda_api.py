@@ -2,8 +2,12 @@ import boto3
 import json
 import zipfile
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from manage_project import get_async_s3_paths, split_s3_uri
+
 class LambdaAPIDeployment:
     def __init__(self, region='eu-west-3'):
         """Initialise le déploiement Lambda et API Gateway"""
@@ -11,6 +15,31 @@ class LambdaAPIDeployment:
         self.lambda_client = boto3.client('lambda', region_name=region)
         self.api_gateway_client = boto3.client('apigateway', region_name=region)
         self.iam_client = boto3.client('iam', region_name=region)
+        self.sts_client = boto3.client('sts', region_name=region)
+        self._account_id = None
+    
+    @property
+    def account_id(self):
+        """ID du compte AWS (un seul appel STS par déploiement)"""
+        if self._account_id is None:
+            self._account_id = self.sts_client.get_caller_identity()['Account']
+        return self._account_id
+    
+    def wait_for_role(self, role_name, policy_name, max_wait=30):
+        """Attend que le rôle et sa politique soient visibles dans IAM (backoff exponentiel)"""
+        delay = 0.5
+        deadline = time.time() + max_wait
+        
+        while True:
+            try:
+                self.iam_client.get_role(RoleName=role_name)
+                self.iam_client.get_role_policy(RoleName=role_name, PolicyName=policy_name)
+                return True
+            except self.iam_client.exceptions.NoSuchEntityException:
+                if time.time() + delay > deadline:
+                    return False
+                time.sleep(delay)
+                delay = min(delay * 2, 5)
         
     def create_lambda_role(self):
         """Crée le rôle IAM pour la Lambda function"""
@@ -32,6 +61,9 @@ class LambdaAPIDeployment:
             ]
         }
         
+        async_input_bucket, async_input_prefix = split_s3_uri(get_async_s3_paths()[0])
+        async_input_arn = f"arn:aws:s3:::{async_input_bucket}/{async_input_prefix + '/' if async_input_prefix else ''}*"
+        
         # Politique d'autorisation pour SageMaker
         sagemaker_policy = {
             "Version": "2012-10-17",
@@ -39,10 +71,20 @@ class LambdaAPIDeployment:
                 {
                     "Effect": "Allow",
                     "Action": [
-                        "sagemaker:InvokeEndpoint"
+                        "sagemaker:InvokeEndpoint",
+                        "sagemaker:InvokeEndpointAsync"
                     ],
                     "Resource": f"arn:aws:sagemaker:{self.region}:*:endpoint/bankruptcy-predictor-optimized-compatible-*"
                 },
+                {
+                    # Dépôt des entrées de l'inférence asynchrone, limité au bucket et au
+                    # préfixe configurés (ASYNC_INPUT_S3, comme la Lambda et manage_project.py)
+                    "Effect": "Allow",
+                    "Action": [
+                        "s3:PutObject"
+                    ],
+                    "Resource": async_input_arn
+                },
                 {
                     "Effect": "Allow",
                     "Action": [
@@ -79,15 +121,26 @@ class LambdaAPIDeployment:
             role_arn = role_response['Role']['Arn']
             print(f"Rôle créé: {role_arn}")
             
-            # Attendre que le rôle soit prêt
-            import time
-            time.sleep(10)
+            # Attendre que le rôle soit propagé (cohérence à terme d'IAM)
+            if not self.wait_for_role(role_name, 'SageMakerInvokePolicy'):
+                print(f"Rôle {role_name} pas encore visible, poursuite du déploiement")
             
             return role_arn
             
         except self.iam_client.exceptions.EntityAlreadyExistsException:
             print(f"Rôle {role_name} existe déjà")
-            return f"arn:aws:iam::{boto3.client('sts').get_caller_identity()['Account']}:role/{role_name}"
+            # Mettre à jour la politique SageMaker (un rôle antérieur peut ne pas
+            # autoriser InvokeEndpointAsync ni le dépôt S3 des entrées asynchrones)
+            try:
+                self.iam_client.put_role_policy(
+                    RoleName=role_name,
+                    PolicyName='SageMakerInvokePolicy',
+                    PolicyDocument=json.dumps(sagemaker_policy)
+                )
+                print("Politique SageMaker mise à jour")
+            except Exception as e:
+                print(f"Erreur lors de la mise à jour de la politique: {str(e)}")
+            return f"arn:aws:iam::{self.account_id}:role/{role_name}"
         except Exception as e:
             print(f"Erreur lors de la création du rôle: {str(e)}")
             return None
@@ -98,6 +151,14 @@ class LambdaAPIDeployment:
         
         package_name = 'lambda_bankruptcy_prediction.zip'
         
+        # Réutiliser le package s'il est plus récent que ses sources
+        # (il peut avoir été préparé par deploy.py pendant la création de l'endpoint)
+        sources = [src for src in ('lambda_function.py', 'config.py') if os.path.exists(src)]
+        if os.path.exists(package_name) and all(
+                os.path.getmtime(package_name) >= os.path.getmtime(src) for src in sources):
+            print(f"Package à jour: {package_name}")
+            return package_name
+        
         with zipfile.ZipFile(package_name, 'w', zipfile.ZIP_DEFLATED) as zip_file:
             # Ajouter le code Lambda
             zip_file.write('lambda_function.py', 'lambda_function.py')
@@ -137,7 +198,6 @@ class LambdaAPIDeployment:
                 )
                 
                 # Attendre que la mise à jour du code soit terminée
-                import time
                 time.sleep(5)
                 
                 # Mettre à jour les variables d'environnement
@@ -152,22 +212,30 @@ class LambdaAPIDeployment:
                 
                 print(f"Lambda function mise à jour: {function_name}")
             except self.lambda_client.exceptions.ResourceNotFoundException:
-                # Créer une nouvelle fonction
-                response = self.lambda_client.create_function(
-                    FunctionName=function_name,
-                    Runtime='python3.9',
-                    Role=role_arn,
-                    Handler='lambda_function.lambda_handler',
-                    Code={'ZipFile': zip_content},
-                    Description='API Lambda pour la prédiction de faillite d\'entreprises',
-                    Timeout=30,
-                    MemorySize=256,
-                    Environment={
-                        'Variables': {
-                            'SAGEMAKER_ENDPOINT_NAME': 'bankruptcy-predictor-optimized-compatible-20250922-143917'
-                        }
-                    }
-                )
+                # Créer une nouvelle fonction (un rôle tout juste créé peut ne pas
+                # encore être assumable par Lambda : réessayer avec backoff)
+                for attempt in range(5):
+                    try:
+                        response = self.lambda_client.create_function(
+                            FunctionName=function_name,
+                            Runtime='python3.9',
+                            Role=role_arn,
+                            Handler='lambda_function.lambda_handler',
+                            Code={'ZipFile': zip_content},
+                            Description='API Lambda pour la prédiction de faillite d\'entreprises',
+                            Timeout=30,
+                            MemorySize=256,
+                            Environment={
+                                'Variables': {
+                                    'SAGEMAKER_ENDPOINT_NAME': 'bankruptcy-predictor-optimized-compatible-20250922-143917'
+                                }
+                            }
+                        )
+                        break
+                    except self.lambda_client.exceptions.InvalidParameterValueException:
+                        if attempt == 4:
+                            raise
+                        time.sleep(2 ** attempt)
                 print(f"Lambda function créée: {function_name}")
             
             function_arn = response['FunctionArn']
@@ -179,6 +247,85 @@ class LambdaAPIDeployment:
             print(f"Erreur lors du déploiement Lambda: {str(e)}")
             return None
     
+    def setup_post_method(self, api_id, resource_id, lambda_arn):
+        """Crée la méthode POST et son intégration Lambda proxy"""
+        self.api_gateway_client.put_method(
+            restApiId=api_id,
+            resourceId=resource_id,
+            httpMethod='POST',
+            authorizationType='NONE'
+        )
+        print("Méthode POST créée")
+        
+        self.api_gateway_client.put_integration(
+            restApiId=api_id,
+            resourceId=resource_id,
+            httpMethod='POST',
+            type='AWS_PROXY',
+            integrationHttpMethod='POST',
+            uri=f"arn:aws:apigateway:{self.region}:lambda:path/2015-03-31/functions/{lambda_arn}/invocations"
+        )
+        print("Intégration Lambda configurée pour POST")
+    
+    def setup_options_method(self, api_id, resource_id):
+        """Crée la méthode OPTIONS (préflight CORS) avec une intégration MOCK"""
+        self.api_gateway_client.put_method(
+            restApiId=api_id,
+            resourceId=resource_id,
+            httpMethod='OPTIONS',
+            authorizationType='NONE'
+        )
+        print("Méthode OPTIONS créée")
+        
+        self.api_gateway_client.put_integration(
+            restApiId=api_id,
+            resourceId=resource_id,
+            httpMethod='OPTIONS',
+            type='MOCK',
+            requestTemplates={'application/json': '{"statusCode": 200}'}
+        )
+        print("Intégration OPTIONS configurée")
+        
+        # Configurer les réponses pour OPTIONS
+        self.api_gateway_client.put_method_response(
+            restApiId=api_id,
+            resourceId=resource_id,
+            httpMethod='OPTIONS',
+            statusCode='200',
+            responseParameters={
+                'method.response.header.Access-Control-Allow-Origin': True,
+                'method.response.header.Access-Control-Allow-Headers': True,
+                'method.response.header.Access-Control-Allow-Methods': True
+            }
+        )
+        
+        # Configurer les réponses d'intégration pour OPTIONS
+        self.api_gateway_client.put_integration_response(
+            restApiId=api_id,
+            resourceId=resource_id,
+            httpMethod='OPTIONS',
+            statusCode='200',
+            responseParameters={
+                'method.response.header.Access-Control-Allow-Origin': "'*'",
+                'method.response.header.Access-Control-Allow-Headers': "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'",
+                'method.response.header.Access-Control-Allow-Methods': "'POST,OPTIONS'"
+            }
+        )
+    
+    def grant_api_gateway_permission(self, lambda_arn, api_id):
+        """Donne la permission à API Gateway d'invoquer Lambda"""
+        try:
+            self.lambda_client.add_permission(
+                FunctionName=lambda_arn,
+                StatementId='api-gateway-invoke',
+                Action='lambda:InvokeFunction',
+                Principal='apigateway.amazonaws.com',
+                SourceArn=f"arn:aws:execute-api:{self.region}:{self.account_id}:{api_id}/*/*"
+            )
+            print("Permission API Gateway accordée")
+        except self.lambda_client.exceptions.ResourceConflictException:
+            print("Permission API Gateway déjà accordée")
+    
     def create_api_gateway(self, lambda_arn):
         """Crée l'API Gateway"""
         print("Création de l'API Gateway...")
@@ -210,70 +357,14 @@ class LambdaAPIDeployment:
             resource_id = resource_response['id']
             print(f"Ressource /predict créée: {resource_id}")
             
-            # Créer la méthode POST
-            method_response = self.api_gateway_client.put_method(
-                restApiId=api_id,
-                resourceId=resource_id,
-                httpMethod='POST',
-                authorizationType='NONE'
-            )
-            print("Méthode POST créée")
-            
-            # Créer la méthode OPTIONS pour CORS
-            self.api_gateway_client.put_method(
-                restApiId=api_id,
-                resourceId=resource_id,
-                httpMethod='OPTIONS',
-                authorizationType='NONE'
-            )
-            print("Méthode OPTIONS créée")
-            
-            # Configurer l'intégration Lambda pour POST
-            integration_response = self.api_gateway_client.put_integration(
-                restApiId=api_id,
-                resourceId=resource_id,
-                httpMethod='POST',
-                type='AWS_PROXY',
-                integrationHttpMethod='POST',
-                uri=f"arn:aws:apigateway:{self.region}:lambda:path/2015-03-31/functions/{lambda_arn}/invocations"
-            )
-            print("Intégration Lambda configurée pour POST")
-            
-            # Configurer l'intégration Lambda pour OPTIONS
-            self.api_gateway_client.put_integration(
-                restApiId=api_id,
-                resourceId=resource_id,
-                httpMethod='OPTIONS',
-                type='MOCK',
-                requestTemplates={'application/json': '{"statusCode": 200}'}
-            )
-            print("Intégration OPTIONS configurée")
-            
-            # Configurer les réponses pour OPTIONS
-            self.api_gateway_client.put_method_response(
-                restApiId=api_id,
-                resourceId=resource_id,
-                httpMethod='OPTIONS',
-                statusCode='200',
-                responseParameters={
-                    'method.response.header.Access-Control-Allow-Origin': True,
-                    'method.response.header.Access-Control-Allow-Headers': True,
-                    'method.response.header.Access-Control-Allow-Methods': True
-                }
-            )
-            
-            # Configurer les réponses d'intégration pour OPTIONS
-            self.api_gateway_client.put_integration_response(
-                restApiId=api_id,
-                resourceId=resource_id,
-                httpMethod='OPTIONS',
-                statusCode='200',
-                responseParameters={
-                    'method.response.header.Access-Control-Allow-Origin': "'*'",
-                    'method.response.header.Access-Control-Allow-Headers': "'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token'",
-                    'method.response.header.Access-Control-Allow-Methods': "'POST,OPTIONS'"
-                }
-            )
+            # Les chaînes POST et OPTIONS restent séquentielles : API Gateway rejette les
+            # modifications concurrentes d'une même API (ConflictException). Seule la
+            # permission Lambda (autre service) est accordée en parallèle
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                permission_future = executor.submit(self.grant_api_gateway_permission, lambda_arn, api_id)
+                self.setup_post_method(api_id, resource_id, lambda_arn)
+                self.setup_options_method(api_id, resource_id)
+                permission_future.result()
             
             # Déployer l'API
             deployment_response = self.api_gateway_client.create_deployment(
@@ -283,23 +374,6 @@ class LambdaAPIDeployment:
             )
             print("API déployée en production")
             
-            # Donner la permission à API Gateway d'invoquer Lambda
-            try:
-                # Obtenir l'account ID
-                sts_client = boto3.client('sts', region_name=self.region)
-                account_id = sts_client.get_caller_identity()['Account']
-                
-                self.lambda_client.add_permission(
-                    FunctionName=lambda_arn,
-                    StatementId='api-gateway-invoke',
-                    Action='lambda:InvokeFunction',
-                    Principal='apigateway.amazonaws.com',
-                    SourceArn=f"arn:aws:execute-api:{self.region}:{account_id}:{api_id}/*/*"
-                )
-                print("Permission API Gateway accordée")
-            except self.lambda_client.exceptions.ResourceConflictException:
-                print("Permission API Gateway déjà accordée")
-            
             # URL de l'API
             api_url = f"https://{api_id}.execute-api.{self.region}.amazonaws.com/prod/predict"
             print(f"URL de l'API: {api_url}")
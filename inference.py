@@ -4,6 +4,15 @@ import numpy as np
 import os
 import logging
 
+# orjson (2 à 5x plus rapide) si disponible dans le conteneur, sinon json standard
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,28 +20,35 @@ logger = logging.getLogger(__name__)
 class OptimizedMLPPredictor:
     def __init__(self):
         self.model = None
-        self.scaler = None
-        self.selected_features = None
+        self._n_features = None
         self.model_loaded = False
+        
+        # Buffer d'entrée réutilisé pour les requêtes d'une seule ligne (alloué dans model_fn).
+        # Non thread-safe : chaque worker SageMaker a sa propre instance du prédicteur
+        # et traite ses requêtes en série.
+        self._buf = None
     
     def model_fn(self, model_dir):
+        # Artefacts déjà chargés par ce worker : rien à relire
+        if self.model_loaded:
+            return self
+        
         try:
             logger.info(f"Chargement du modèle depuis: {model_dir}")
             
-            # Charger le modèle
-            model_path = os.path.join(model_dir, 'MLPClassifier_optimized.pkl')
-            self.model = joblib.load(model_path)
+            # Un seul fichier à lire : modèle (StandardScaler déjà fusionné dans la
+            # première couche) et nombre de features attendu. Les tableaux numpy du pickle
+            # (non compressé) sont mappés en mémoire (mmap_mode='r') au lieu d'être copiés
+            bundle_path = os.path.join(model_dir, 'bundle.joblib')
+            bundle = joblib.load(bundle_path, mmap_mode='r')
+            
+            self.model = bundle['model']
             logger.info("Modèle MLPClassifier chargé avec succès")
             
-            # Charger le scaler
-            scaler_path = os.path.join(model_dir, 'scaler_optimized.pkl')
-            self.scaler = joblib.load(scaler_path)
-            logger.info("Scaler chargé avec succès")
+            self._n_features = bundle['n_features']
+            logger.info(f"Nombre de features attendu: {self._n_features}")
             
-            # Charger les features sélectionnées
-            features_path = os.path.join(model_dir, 'selected_features_optimized.pkl')
-            self.selected_features = joblib.load(features_path)
-            logger.info(f"Features sélectionnées chargées: {len(self.selected_features)}")
+            self._buf = np.empty((1, self._n_features), dtype=np.float32)
             
             self.model_loaded = True
             logger.info("Tous les artefacts chargés avec succès")
@@ -48,33 +64,32 @@ class OptimizedMLPPredictor:
         try:
             if content_type == 'application/json':
                 # Charger les données JSON
-                data = json.loads(request_body)
+                data = json_loads(request_body)
                 
-                # Convertir en numpy array
+                # Cas courant (une ligne de la bonne taille) : écrire dans le buffer préalloué
+                if (isinstance(data, list) and len(data) == self._n_features
+                        and not isinstance(data[0], list)):
+                    self._buf[0, :] = data
+                    return self._buf[0]
+                
+                # Convertir en numpy array : une liste de listes donne un batch 2-D (N, F)
                 if isinstance(data, list):
                     # Données sous forme de liste
-                    input_data = np.array(data, dtype=np.float32)
+                    input_data = np.ascontiguousarray(data, dtype=np.float32)
                 elif isinstance(data, dict):
                     # Données sous forme de dictionnaire
                     if 'data' in data:
-                        input_data = np.array(data['data'], dtype=np.float32)
+                        input_data = np.ascontiguousarray(data['data'], dtype=np.float32)
                     else:
                         # Prendre toutes les valeurs du dictionnaire
-                        input_data = np.array(list(data.values()), dtype=np.float32)
+                        input_data = np.fromiter(data.values(), dtype=np.float32, count=len(data))
                 else:
                     raise ValueError("Format de données non supporté")
                 
-                # Vérifier le nombre de features
-                expected_features = len(self.selected_features)
-                if len(input_data) != expected_features:
-                    logger.warning(f"Nombre de features reçu: {len(input_data)}, attendu: {expected_features}")
-                    # Ajuster si nécessaire
-                    if len(input_data) > expected_features:
-                        input_data = input_data[:expected_features]
-                    else:
-                        # Compléter avec des zéros
-                        padding = np.zeros(expected_features - len(input_data))
-                        input_data = np.concatenate([input_data, padding])
+                # Vérifier le nombre de features (dernier axe, ligne seule ou batch) :
+                # une entrée mal dimensionnée est rejetée plutôt que tronquée ou complétée
+                if input_data.ndim not in (1, 2) or input_data.shape[-1] != self._n_features:
+                    raise ValueError(f"Forme des données reçue: {input_data.shape}, attendu: ({self._n_features},) ou (N, {self._n_features})")
                 
                 logger.info(f"Données d'entrée traitées: shape {input_data.shape}")
                 return input_data
@@ -92,29 +107,37 @@ class OptimizedMLPPredictor:
             if not self.model_loaded:
                 raise ValueError("Modèle non chargé")
             
-            # Reshape pour une seule prédiction
-            if input_data.ndim == 1:
+            # Une ligne seule est traitée comme un batch de taille 1
+            single = input_data.ndim == 1
+            if single:
                 input_data = input_data.reshape(1, -1)
             
-            # Normaliser les données
-            input_scaled = self.scaler.transform(input_data)
+            # Prédire tout le batch en une passe, sur les données brutes
+            # (la normalisation est fusionnée dans les poids de la première couche)
+            predictions_proba = self.model.predict_proba(input_data)
+            
+            # predict() referait la passe avant : la classe est l'argmax des probabilités
+            predictions = self.model.classes_[np.argmax(predictions_proba, axis=1)]
             
-            # Faire la prédiction
-            prediction = self.model.predict(input_scaled)[0]
-            prediction_proba = self.model.predict_proba(input_scaled)[0]
+            # Préparer la réponse (une entrée par ligne)
+            results = [
+                {
+                    'prediction': int(prediction),
+                    'probability': {
+                        'not_bankrupt': float(prediction_proba[0]),
+                        'bankrupt': float(prediction_proba[1])
+                    },
+                    'risk_level': 'high' if prediction_proba[1] > 0.7 else 'medium' if prediction_proba[1] > 0.3 else 'low'
+                }
+                for prediction, prediction_proba in zip(predictions, predictions_proba)
+            ]
             
-            # Préparer la réponse
-            result = {
-                'prediction': int(prediction),
-                'probability': {
-                    'not_bankrupt': float(prediction_proba[0]),
-                    'bankrupt': float(prediction_proba[1])
-                },
-                'risk_level': 'high' if prediction_proba[1] > 0.7 else 'medium' if prediction_proba[1] > 0.3 else 'low'
-            }
+            if single:
+                logger.info(f"Prédiction effectuée: {results[0]}")
+                return results[0]
             
-            logger.info(f"Prédiction effectuée: {result}")
-            return result
+            logger.info(f"Prédictions effectuées: {len(results)} lignes")
+            return results
             
         except Exception as e:
             logger.error(f"Erreur lors de la prédiction: {str(e)}")
@@ -124,9 +147,9 @@ class OptimizedMLPPredictor:
         """Formate la sortie"""
         try:
             if accept == 'application/json':
-                return json.dumps(prediction), 'application/json'
+                return json_dumps(prediction), 'application/json'
             else:
-                return json.dumps(prediction), 'application/json'
+                return json_dumps(prediction), 'application/json'
                 
         except Exception as e:
             logger.error(f"Erreur lors du formatage de la sortie: {str(e)}")
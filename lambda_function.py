@@ -1,9 +1,16 @@
 import json
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 import logging
 import os
 from typing import Dict, Any
 
+# Réponses au format « Lambda proxy integration » d'une API REST API Gateway
+# (payload v1, créée par deploy_lambda_api.py) : le champ 'body' doit être une
+# chaîne. Il est sérialisé une seule fois (json_dumps) et 'isBase64Encoded' est
+# explicitement à False pour qu'API Gateway le transmette tel quel.
+
 # Configuration du logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -18,40 +25,177 @@ except ImportError:
         'AWS_REGION': os.environ.get('AWS_REGION', 'eu-west-3')
     }
 
+# En-têtes de réponse constants, construits une seule fois (jamais modifiés par la suite)
+_CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+    'Access-Control-Allow-Methods': 'POST,OPTIONS'
+}
+_JSON_HEADERS = {'Content-Type': 'application/json', **_CORS_HEADERS}
+
+# Partie constante des métadonnées du modèle ajoutées à chaque réponse
+_MODEL_INFO_CONST = {
+    'model_type': 'MLPClassifier',
+    'roc_auc': 0.9936,
+    'features_used': 50
+}
+
+# Nombre maximal de lignes par requête batch (le corps reste sous la limite
+# de 6 Mo des payloads Lambda)
+MAX_BATCH_SIZE = 1000
+
+# Sérialisation JSON : orjson (2 à 5x plus rapide) si présent dans le package ou
+# une layer, sinon json standard en forme compacte (sans indentation ni espaces)
+# (json_dumps_bytes : corps des appels SageMaker, transmis en octets sans ré-encodage)
+try:
+    import orjson
+    
+    def json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+    
+    json_dumps_bytes = orjson.dumps
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps(obj: Any) -> str:
+        return json.dumps(obj, separators=(',', ':'))
+    
+    def json_dumps_bytes(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode()
+    
+    json_loads = json.loads
+
+# Clients créés une seule fois par conteneur Lambda (hors du handler) :
+# les invocations à chaud réutilisent le pool de connexions HTTPS
+# (read_timeout < timeout Lambda de 30 s pour pouvoir renvoyer une erreur propre)
+_boto_cfg = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={'max_attempts': 2, 'mode': 'standard'},
+    connect_timeout=2,
+    read_timeout=25
+)
+
 # Client SageMaker Runtime
-sagemaker_runtime = boto3.client('sagemaker-runtime', region_name=config['AWS_REGION'])
-sagemaker_client = boto3.client('sagemaker', region_name=config['AWS_REGION'])
+sagemaker_runtime = boto3.client('sagemaker-runtime', region_name=config['AWS_REGION'], config=_boto_cfg)
+
+# Nom d'endpoint inexistant (mais couvert par la politique IAM de la Lambda) utilisé
+# pour le préchauffage : SageMaker répond ValidationError sans aucune inférence
+PREWARM_ENDPOINT_NAME = 'bankruptcy-predictor-optimized-compatible-prewarm'
+
+def prewarm_sagemaker_connection():
+    """
+    Ouvre la connexion TCP+TLS vers sagemaker-runtime pendant la phase d'init
+    (hors de la fenêtre facturée de la première requête), par un appel public du
+    client : la connexion reste ensuite dans son pool. Ne lève jamais : en cas
+    d'échec, la connexion sera simplement établie au premier appel.
+    """
+    try:
+        sagemaker_runtime.invoke_endpoint(
+            EndpointName=PREWARM_ENDPOINT_NAME,
+            ContentType='application/json',
+            Body=b'{}'
+        )
+    except ClientError:
+        # Réponse d'erreur attendue : la connexion est établie
+        pass
+    except Exception as e:
+        logger.warning(f"Préchauffage de la connexion SageMaker impossible: {e}")
+
+# Uniquement dans l'environnement Lambda (pas lors d'un import local)
+if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    prewarm_sagemaker_connection()
+
+# Client SageMaker (control plane) : créé seulement si la découverte par
+# list_endpoints est nécessaire (SAGEMAKER_ENDPOINT_NAME absent)
+sagemaker_client = None
+
+# Client S3 : créé seulement pour les requêtes asynchrones (dépôt de l'entrée)
+s3_client = None
+
+# Nom de l'endpoint résolu, conservé entre les invocations à chaud
+_cached_endpoint_name = None
 
 def get_active_endpoint():
     """Trouve automatiquement l'endpoint SageMaker actif"""
+    global _cached_endpoint_name, sagemaker_client
+    if _cached_endpoint_name:
+        return _cached_endpoint_name
+    
     # D'abord, essayer de charger depuis les variables d'environnement
     endpoint_name = os.environ.get('SAGEMAKER_ENDPOINT_NAME')
     if endpoint_name:
+        _cached_endpoint_name = endpoint_name
         return endpoint_name
     
     # Sinon, essayer de lister les endpoints
     try:
+        if sagemaker_client is None:
+            sagemaker_client = boto3.client('sagemaker', region_name=config['AWS_REGION'], config=_boto_cfg)
         response = sagemaker_client.list_endpoints()
         for endpoint in response['Endpoints']:
-            if 'bankruptcy-predictor' in endpoint['EndpointName']:
-                return endpoint['EndpointName']
+            # Les endpoints asynchrones ne répondent pas à invoke_endpoint
+            if 'bankruptcy-predictor' in endpoint['EndpointName'] and '-async-' not in endpoint['EndpointName']:
+                _cached_endpoint_name = endpoint['EndpointName']
+                return _cached_endpoint_name
         return None
     except Exception as e:
         logger.error(f"Erreur lors de la découverte de l'endpoint: {e}")
         return None
 
+def invalidate_endpoint_cache():
+    """Oublie l'endpoint mis en cache (il sera résolu à nouveau au prochain appel)"""
+    global _cached_endpoint_name
+    _cached_endpoint_name = None
+
+def is_endpoint_not_found(error: Exception) -> bool:
+    """Indique si l'erreur SageMaker signale un endpoint inexistant"""
+    if not isinstance(error, ClientError):
+        return False
+    details = error.response.get('Error', {})
+    return details.get('Code') == 'ValidationError' and 'not found' in details.get('Message', '')
+
+def parse_features(data: Any):
+    """
+    Valide 'data' (50 valeurs, ou liste de lignes de 50 valeurs en mode batch)
+    et convertit les valeurs en float. Retourne (données, is_batch) ou lève
+    ValueError avec le message d'erreur destiné au client.
+    """
+    if not isinstance(data, list):
+        raise ValueError("Le champ 'data' doit être une liste")
+    
+    # Mode batch : une liste de lignes de 50 valeurs, envoyée en un seul appel SageMaker
+    is_batch = bool(data) and isinstance(data[0], list)
+    rows = data if is_batch else (data,)
+    
+    if len(rows) > MAX_BATCH_SIZE:
+        raise ValueError(f"Le champ 'data' doit contenir au plus {MAX_BATCH_SIZE} lignes, reçu: {len(rows)}")
+    
+    try:
+        # map exécute la conversion en C ; la longueur est vérifiée sur la ligne convertie
+        converted = [list(map(float, row)) if isinstance(row, list) else None for row in rows]
+    except (ValueError, TypeError):
+        raise ValueError("Toutes les valeurs dans 'data' doivent être numériques")
+    
+    if any(row is None or len(row) != 50 for row in converted):
+        if is_batch:
+            raise ValueError("Chaque ligne de 'data' doit être une liste de exactement 50 valeurs")
+        raise ValueError(f"Le champ 'data' doit contenir exactement 50 valeurs, reçu: {len(data)}")
+    
+    return (converted if is_batch else converted[0]), is_batch
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Handler principal de la Lambda function
     """
     try:
-        # Log de la requête
-        logger.info(f"Requête reçue: {json.dumps(event)}")
+        # Log de la requête (sérialisée uniquement si le niveau DEBUG est actif)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Requête reçue: %s", json.dumps(event))
         
         # Extraire les données de la requête
         if 'body' in event:
             # Requête depuis API Gateway
-            body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+            body = json_loads(event['body']) if isinstance(event['body'], str) else event['body']
         else:
             # Requête directe
             body = event
@@ -60,20 +204,18 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if 'data' not in body:
             return create_error_response(400, "Champ 'data' manquant dans la requête")
         
-        data = body['data']
-        
-        # Valider le format des données
-        if not isinstance(data, list):
-            return create_error_response(400, "Le champ 'data' doit être une liste")
-        
-        if len(data) != 50:
-            return create_error_response(400, f"Le champ 'data' doit contenir exactement 50 valeurs, reçu: {len(data)}")
-        
-        # Valider que toutes les valeurs sont numériques
+        # Valider et convertir les données en une seule passe
         try:
-            data = [float(x) for x in data]
-        except (ValueError, TypeError):
-            return create_error_response(400, "Toutes les valeurs dans 'data' doivent être numériques")
+            data, is_batch = parse_features(body['data'])
+        except ValueError as e:
+            return create_error_response(400, str(e))
+        
+        # Inférence asynchrone demandée : la requête est mise en file, le résultat sera écrit sur S3
+        if body.get('async'):
+            response = call_sagemaker_endpoint_async(data, context.aws_request_id)
+            if response['ok']:
+                return create_success_response(response['result'], status_code=202)
+            return create_error_response(response.get('status_code', 500), response['error'])
         
         # Trouver l'endpoint actif
         endpoint_name = get_active_endpoint()
@@ -83,28 +225,31 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         # Appeler le endpoint SageMaker
         response = call_sagemaker_endpoint(data, endpoint_name)
         
-        # Traiter la réponse
-        if response['statusCode'] == 200:
-            result = json.loads(response['body'])
+        # Traiter la réponse (déjà décodée : pas d'aller-retour JSON)
+        if response['ok']:
+            result = response['result']
             
-            # Ajouter des métadonnées
-            enhanced_result = {
-                'prediction': result['prediction'],
-                'probability': result['probability'],
-                'risk_level': result['risk_level'],
-                'confidence': max(result['probability']['not_bankrupt'], result['probability']['bankrupt']),
-                'model_info': {
-                    'model_type': 'MLPClassifier',
-                    'roc_auc': 0.9936,
-                    'features_used': 50,
-                    'endpoint': endpoint_name
-                },
-                'timestamp': context.aws_request_id
-            }
+            # Ajouter des métadonnées (en batch, chaque champ est une liste alignée sur les lignes)
+            if is_batch:
+                enhanced_result = {
+                    'prediction': [row['prediction'] for row in result],
+                    'probability': [row['probability'] for row in result],
+                    'risk_level': [row['risk_level'] for row in result],
+                    'confidence': [max(row['probability']['not_bankrupt'], row['probability']['bankrupt']) for row in result]
+                }
+            else:
+                enhanced_result = {
+                    'prediction': result['prediction'],
+                    'probability': result['probability'],
+                    'risk_level': result['risk_level'],
+                    'confidence': max(result['probability']['not_bankrupt'], result['probability']['bankrupt'])
+                }
+            enhanced_result['model_info'] = {**_MODEL_INFO_CONST, 'endpoint': endpoint_name}
+            enhanced_result['timestamp'] = context.aws_request_id
             
             return create_success_response(enhanced_result)
         else:
-            return response
+            return create_error_response(500, response['error'])
             
     except Exception as e:
         logger.error(f"Erreur dans lambda_handler: {str(e)}")
@@ -112,42 +257,89 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
 def call_sagemaker_endpoint(data: list, endpoint_name: str) -> Dict[str, Any]:
     """
-    Appelle le endpoint SageMaker
+    Appelle le endpoint SageMaker.
+    Retourne {'ok': True, 'result': <réponse décodée>} ou {'ok': False, 'error': <message>}
     """
     try:
-        logger.info(f"Appel du endpoint SageMaker {endpoint_name} avec {len(data)} features")
+        if data and isinstance(data[0], list):
+            logger.info(f"Appel du endpoint SageMaker {endpoint_name} avec un batch de {len(data)} lignes")
+        else:
+            logger.info(f"Appel du endpoint SageMaker {endpoint_name} avec {len(data)} features")
         
         # Appeler le endpoint
         response = sagemaker_runtime.invoke_endpoint(
             EndpointName=endpoint_name,
             ContentType='application/json',
-            Body=json.dumps(data)
+            Body=json_dumps_bytes(data)
         )
         
-        # Lire la réponse
-        result = json.loads(response['Body'].read().decode())
+        # Lire la réponse (les octets sont parsés directement, sans décodage intermédiaire)
+        result = json_loads(response['Body'].read())
         
-        logger.info(f"Réponse SageMaker: {result}")
+        logger.debug("Réponse SageMaker: %s", result)
         
-        return create_success_response(result)
+        return {'ok': True, 'result': result}
         
     except Exception as e:
+        # Endpoint supprimé (pause/resume) : ne plus utiliser le nom en cache
+        if is_endpoint_not_found(e):
+            invalidate_endpoint_cache()
         logger.error(f"Erreur lors de l'appel SageMaker: {str(e)}")
-        return create_error_response(500, f"Erreur SageMaker: {str(e)}")
+        return {'ok': False, 'error': f"Erreur SageMaker: {str(e)}"}
 
-def create_success_response(data: Dict[str, Any]) -> Dict[str, Any]:
+def call_sagemaker_endpoint_async(data: list, request_id: str) -> Dict[str, Any]:
+    """
+    Dépose les données sur S3 et appelle le endpoint SageMaker asynchrone.
+    Retourne {'ok': True, 'result': {...emplacement du résultat...}} ou {'ok': False, 'error': <message>}
+    """
+    global s3_client
+    endpoint_name = os.environ.get('SAGEMAKER_ASYNC_ENDPOINT_NAME')
+    input_s3 = os.environ.get('ASYNC_INPUT_S3')
+    if not endpoint_name or not input_s3:
+        return {
+            'ok': False,
+            'status_code': 503,
+            'error': "Aucun endpoint SageMaker asynchrone configuré. Utilisez 'python3 manage_project.py resume_async'"
+        }
+    
+    try:
+        if s3_client is None:
+            s3_client = boto3.client('s3', region_name=config['AWS_REGION'], config=_boto_cfg)
+        
+        # Entrée déposée sous ASYNC_INPUT_S3, une clé par requête
+        bucket, _, prefix = input_s3[len('s3://'):].rstrip('/').partition('/')
+        key = f"{prefix}/{request_id}.json" if prefix else f"{request_id}.json"
+        s3_client.put_object(Bucket=bucket, Key=key, Body=json_dumps_bytes(data), ContentType='application/json')
+        
+        logger.info(f"Appel asynchrone du endpoint SageMaker {endpoint_name}")
+        response = sagemaker_runtime.invoke_endpoint_async(
+            EndpointName=endpoint_name,
+            ContentType='application/json',
+            InputLocation=f"s3://{bucket}/{key}"
+        )
+        
+        return {
+            'ok': True,
+            'result': {
+                'inference_id': response['InferenceId'],
+                'output_location': response['OutputLocation'],
+                'endpoint': endpoint_name
+            }
+        }
+        
+    except Exception as e:
+        logger.error(f"Erreur lors de l'appel SageMaker asynchrone: {str(e)}")
+        return {'ok': False, 'error': f"Erreur SageMaker: {str(e)}"}
+
+def create_success_response(data: Dict[str, Any], status_code: int = 200) -> Dict[str, Any]:
     """
     Crée une réponse de succès
     """
     return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-            'Access-Control-Allow-Methods': 'POST,OPTIONS'
-        },
-        'body': json.dumps(data, indent=2)
+        'statusCode': status_code,
+        'headers': _JSON_HEADERS,
+        'body': json_dumps(data),
+        'isBase64Encoded': False
     }
 
 def create_error_response(status_code: int, message: str) -> Dict[str, Any]:
@@ -156,16 +348,12 @@ def create_error_response(status_code: int, message: str) -> Dict[str, Any]:
     """
     return {
         'statusCode': status_code,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-            'Access-Control-Allow-Methods': 'POST,OPTIONS'
-        },
-        'body': json.dumps({
+        'headers': _JSON_HEADERS,
+        'body': json_dumps({
             'error': message,
             'statusCode': status_code
-        }, indent=2)
+        }),
+        'isBase64Encoded': False
     }
 
 def handle_options_request(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -174,10 +362,7 @@ def handle_options_request(event: Dict[str, Any], context: Any) -> Dict[str, Any
     """
     return {
         'statusCode': 200,
-        'headers': {
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-            'Access-Control-Allow-Methods': 'POST,OPTIONS'
-        },
-        'body': ''
+        'headers': _CORS_HEADERS,
+        'body': '',
+        'isBase64Encoded': False
     }
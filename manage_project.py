@@ -1,8 +1,16 @@
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 import argparse
+import functools
+import hashlib
+import json
 import sys
 import os
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import urllib3
 
 # Charger la configuration
 try:
@@ -14,39 +22,125 @@ except ImportError:
         'SAGEMAKER_ENDPOINT_NAME': os.environ.get('SAGEMAKER_ENDPOINT_NAME'),
         'LAMBDA_FUNCTION_NAME': os.environ.get('LAMBDA_FUNCTION_NAME', 'bankruptcy-prediction-api'),
         'API_GATEWAY_ID': os.environ.get('API_GATEWAY_ID'),
-        'AWS_REGION': os.environ.get('AWS_REGION', 'eu-west-3')
+        'AWS_REGION': os.environ.get('AWS_REGION', 'eu-west-3'),
+        'S3_BUCKET_NAME': os.environ.get('S3_BUCKET_NAME'),
+        'ASYNC_INPUT_S3': os.environ.get('ASYNC_INPUT_S3'),
+        'ASYNC_OUTPUT_S3': os.environ.get('ASYNC_OUTPUT_S3')
     }
 
+# Connexions HTTPS persistantes entre les appels successifs d'une même commande
+_boto_cfg = Config(
+    tcp_keepalive=True,
+    retries={'max_attempts': 2, 'mode': 'standard'},
+    connect_timeout=2,
+    read_timeout=25
+)
+
+# Durée pendant laquelle le fichier .endpoint_name est considéré comme fiable
+# sans vérification auprès de SageMaker (secondes)
+ENDPOINT_FILE_TTL = 3600
+
+# Client HTTP pour tester l'API (urllib3 est déjà chargé par botocore)
+_http = urllib3.PoolManager()
+
+# Inférence asynchrone : entrées et sorties passent par S3 (pas de limite de
+# taille de payload ni de timeout API Gateway de 29 s)
+ASYNC_ENDPOINT_FILE = '.async_endpoint_name'
+ASYNC_MAX_CONCURRENT_INVOCATIONS = 4
+
+def get_async_s3_paths():
+    """Préfixes S3 (entrée, sortie) de l'inférence asynchrone"""
+    default_root = f"s3://{config.get('S3_BUCKET_NAME')}/async-inference"
+    input_s3 = config.get('ASYNC_INPUT_S3') or f"{default_root}/input"
+    output_s3 = config.get('ASYNC_OUTPUT_S3') or f"{default_root}/output"
+    return input_s3.rstrip('/'), output_s3.rstrip('/')
+
+def split_s3_uri(uri):
+    """Découpe s3://bucket/cle en (bucket, cle)"""
+    bucket, _, key = uri[len('s3://'):].partition('/')
+    return bucket, key
+
+def endpoint_config_prefix(model_name, async_inference=False):
+    """Préfixe des configurations d'endpoint : le modèle (empreinte courte) et le mode
+    sont encodés dans le nom, ce qui permet de les retrouver avec NameContains"""
+    model_digest = hashlib.md5(model_name.encode()).hexdigest()[:8]
+    return f"bankruptcy-config-{'async' if async_inference else 'sync'}-{model_digest}-"
+
 class ProjectManager:
-    def __init__(self, region=None):
+    def __init__(self, region=None, refresh=False):
         self.region = region or config['AWS_REGION']
-        self.sagemaker_client = boto3.client('sagemaker', region_name=self.region)
-        self.lambda_client = boto3.client('lambda', region_name=self.region)
-        self.api_gateway_client = boto3.client('apigateway', region_name=self.region)
+        self.refresh = refresh
         
         # Noms des ressources déployées
-        self.sagemaker_endpoint = self.get_active_endpoint()
         self.lambda_function = config['LAMBDA_FUNCTION_NAME']
         self.api_gateway_id = config['API_GATEWAY_ID']
         self.api_url = f'https://{self.api_gateway_id}.execute-api.{self.region}.amazonaws.com/prod/predict'
     
+    # Clients AWS créés au premier accès : chaque commande n'initialise que ceux qu'elle utilise
+    # (la commande 'test' n'en crée aucun)
+    @functools.cached_property
+    def sagemaker_client(self):
+        return boto3.client('sagemaker', region_name=self.region, config=_boto_cfg)
+    
+    @functools.cached_property
+    def lambda_client(self):
+        return boto3.client('lambda', region_name=self.region, config=_boto_cfg)
+    
+    @functools.cached_property
+    def api_gateway_client(self):
+        return boto3.client('apigateway', region_name=self.region, config=_boto_cfg)
+    
+    @functools.cached_property
+    def sagemaker_runtime(self):
+        return boto3.client('sagemaker-runtime', region_name=self.region, config=_boto_cfg)
+    
+    @functools.cached_property
+    def s3_client(self):
+        return boto3.client('s3', region_name=self.region, config=_boto_cfg)
+    
+    @functools.cached_property
+    def sagemaker_endpoint(self):
+        return self.get_active_endpoint()
+    
+    @functools.cached_property
+    def async_endpoint(self):
+        try:
+            with open(ASYNC_ENDPOINT_FILE, 'r') as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+    
     def get_active_endpoint(self):
         """Trouve automatiquement l'endpoint SageMaker actif"""
         # D'abord, essayer de charger depuis le fichier sauvegardé
         saved_endpoint = self.load_endpoint_name()
         if saved_endpoint:
+            # Fichier récent : on lui fait confiance sans appel AWS (sauf --refresh)
             try:
-                response = self.sagemaker_client.describe_endpoint(EndpointName=saved_endpoint)
-                if response['EndpointStatus'] == 'InService':
+                age = time.time() - os.path.getmtime('.endpoint_name')
+            except OSError:
+                age = ENDPOINT_FILE_TTL
+            if not self.refresh and age < ENDPOINT_FILE_TTL:
+                return saved_endpoint
+            
+            # Sinon, une seule vérification ciblée de l'endpoint sauvegardé
+            try:
+                self.sagemaker_client.describe_endpoint(EndpointName=saved_endpoint)
+                return saved_endpoint
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ValidationError':
+                    print(f"Erreur lors de la vérification de l'endpoint: {e}")
                     return saved_endpoint
-            except:
-                pass
+            except Exception as e:
+                print(f"Erreur lors de la vérification de l'endpoint: {e}")
+                return saved_endpoint
         
-        # Sinon, chercher dans la liste des endpoints
+        # Endpoint sauvegardé introuvable (ou absent) : chercher dans la liste des endpoints
         try:
-            response = self.sagemaker_client.list_endpoints()
+            response = self.sagemaker_client.list_endpoints(NameContains='bankruptcy-predictor')
             for endpoint in response['Endpoints']:
-                if 'bankruptcy-predictor' in endpoint['EndpointName']:
+                # Les endpoints asynchrones ne peuvent pas servir les appels synchrones de la Lambda
+                if '-async-' not in endpoint['EndpointName']:
                     return endpoint['EndpointName']
             return None
         except Exception as e:
@@ -61,6 +155,46 @@ class ProjectManager:
         except Exception as e:
             print(f"Erreur lors de la sauvegarde de l'endpoint: {e}")
     
+    def find_running_endpoint(self, async_inference=False):
+        """Retourne l'endpoint (synchrone ou asynchrone) déjà en service, sinon None"""
+        endpoint_name = self.async_endpoint if async_inference else self.sagemaker_endpoint
+        if not endpoint_name:
+            return None
+        try:
+            response = self.sagemaker_client.describe_endpoint(EndpointName=endpoint_name)
+            return endpoint_name if response['EndpointStatus'] == 'InService' else None
+        except ClientError:
+            return None
+    
+    def find_reusable_endpoint_config(self, model_name, async_inference=False, max_age=3600):
+        """Cherche la configuration la plus récente (moins d'une heure) pour ce modèle et ce mode"""
+        # Le modèle et le mode sont dans le nom : un seul appel paginé, sans describe.
+        # Une configuration peut être partagée par plusieurs endpoints
+        try:
+            paginator = self.sagemaker_client.get_paginator('list_endpoint_configs')
+            pages = paginator.paginate(
+                NameContains=endpoint_config_prefix(model_name, async_inference),
+                CreationTimeAfter=datetime.now(timezone.utc) - timedelta(seconds=max_age),
+                SortBy='CreationTime',
+                SortOrder='Descending'
+            )
+            for page in pages:
+                if page['EndpointConfigs']:
+                    return page['EndpointConfigs'][0]['EndpointConfigName']
+            return None
+        except Exception as e:
+            print(f"Erreur lors de la recherche d'une configuration réutilisable: {e}")
+            return None
+    
+    def update_lambda_environment(self, **variables):
+        """Met à jour des variables d'environnement de la Lambda en conservant les autres"""
+        current = self.lambda_client.get_function_configuration(FunctionName=self.lambda_function)
+        merged = {**current.get('Environment', {}).get('Variables', {}), **variables}
+        self.lambda_client.update_function_configuration(
+            FunctionName=self.lambda_function,
+            Environment={'Variables': merged}
+        )
+    
     def load_endpoint_name(self):
         """Charge le nom de l'endpoint depuis le fichier"""
         try:
@@ -74,10 +208,23 @@ class ProjectManager:
         print("STATUT DU PROJET BANKRUPTCY PREDICTION")
         print("=" * 60)
         
+        # Les vérifications sont indépendantes : elles sont lancées en parallèle
+        # (les clients sont créés ici, dans le thread principal, avant la soumission)
+        # puis les résultats sont affichés dans un ordre fixe
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            endpoint_future = None
+            if self.sagemaker_endpoint:
+                endpoint_future = executor.submit(self.sagemaker_client.describe_endpoint, EndpointName=self.sagemaker_endpoint)
+            async_future = None
+            if self.async_endpoint:
+                async_future = executor.submit(self.sagemaker_client.describe_endpoint, EndpointName=self.async_endpoint)
+            lambda_future = executor.submit(self.lambda_client.get_function, FunctionName=self.lambda_function)
+            api_future = executor.submit(self.api_gateway_client.get_rest_api, restApiId=self.api_gateway_id)
+        
         # Vérifier SageMaker Endpoint
-        if self.sagemaker_endpoint:
+        if endpoint_future:
             try:
-                response = self.sagemaker_client.describe_endpoint(EndpointName=self.sagemaker_endpoint)
+                response = endpoint_future.result()
                 status = response['EndpointStatus']
                 print(f"SageMaker Endpoint: {status}")
                 if status == 'InService':
@@ -90,9 +237,24 @@ class ProjectManager:
             print("SageMaker Endpoint: Aucun endpoint trouvé")
             print("   Utilisez 'python3 manage_project.py resume' pour créer un endpoint")
         
+        # Vérifier SageMaker Endpoint asynchrone
+        if async_future:
+            try:
+                response = async_future.result()
+                status = response['EndpointStatus']
+                print(f"SageMaker Endpoint asynchrone: {status}")
+                if status == 'InService':
+                    print(f"   Endpoint actif: {self.async_endpoint}")
+                else:
+                    print(f"   Endpoint inactif: {status}")
+            except Exception as e:
+                print(f"SageMaker Endpoint asynchrone: Erreur ({str(e)})")
+        else:
+            print("SageMaker Endpoint asynchrone: Aucun endpoint trouvé")
+        
         # Vérifier Lambda Function
         try:
-            response = self.lambda_client.get_function(FunctionName=self.lambda_function)
+            response = lambda_future.result()
             state = response['Configuration']['State']
             print(f"Lambda Function: {state}")
             if state == 'Active':
@@ -104,7 +266,7 @@ class ProjectManager:
         
         # Vérifier API Gateway
         try:
-            response = self.api_gateway_client.get_rest_api(restApiId=self.api_gateway_id)
+            api_future.result()
             print(f"API Gateway: Actif")
             print(f"   API active: {self.api_gateway_id}")
             print(f"   URL: {self.api_url}")
@@ -114,45 +276,57 @@ class ProjectManager:
         print("\n" + "=" * 60)
 
     def pause(self):
-        """Met en pause les ressources (supprime l'endpoint SageMaker)"""
+        """Met en pause les ressources (supprime les endpoints SageMaker synchrone et asynchrone)"""
         print("MISE EN PAUSE DU PROJET")
         print("=" * 40)
         
         try:
-            # Supprimer l'endpoint SageMaker
-            print(f"Suppression de l'endpoint SageMaker: {self.sagemaker_endpoint}")
-            self.sagemaker_client.delete_endpoint(EndpointName=self.sagemaker_endpoint)
-            print("Endpoint SageMaker supprimé")
-            
-            # Supprimer la configuration d'endpoint
-            try:
-                self.sagemaker_client.delete_endpoint_config(
-                    EndpointConfigName=self.sagemaker_endpoint
-                )
-                print("Configuration d'endpoint supprimée")
-            except:
-                pass
-            
-            # Supprimer le fichier d'endpoint
-            try:
-                import os
-                if os.path.exists('.endpoint_name'):
-                    os.remove('.endpoint_name')
-            except:
-                pass
+            # Supprimer les endpoints SageMaker (synchrone puis asynchrone)
+            for endpoint_name, endpoint_file in ((self.sagemaker_endpoint, '.endpoint_name'),
+                                                 (self.async_endpoint, ASYNC_ENDPOINT_FILE)):
+                if not endpoint_name:
+                    continue
+                # Configuration réellement utilisée (bankruptcy-config-*), lue avant la suppression
+                try:
+                    endpoint_config_name = self.sagemaker_client.describe_endpoint(
+                        EndpointName=endpoint_name
+                    )['EndpointConfigName']
+                except:
+                    endpoint_config_name = endpoint_name
+                
+                print(f"Suppression de l'endpoint SageMaker: {endpoint_name}")
+                self.sagemaker_client.delete_endpoint(EndpointName=endpoint_name)
+                print("Endpoint SageMaker supprimé")
+                
+                # Supprimer la configuration d'endpoint
+                try:
+                    self.sagemaker_client.delete_endpoint_config(
+                        EndpointConfigName=endpoint_config_name
+                    )
+                    print("Configuration d'endpoint supprimée")
+                except:
+                    pass
+                
+                # Supprimer le fichier d'endpoint
+                try:
+                    if os.path.exists(endpoint_file):
+                        os.remove(endpoint_file)
+                except:
+                    pass
             
             print("\nPROJET EN PAUSE")
             print("   - Lambda Function: Conservée")
             print("   - API Gateway: Conservé")
             print("   - SageMaker Endpoint: Supprimé (économies)")
+            print("   - SageMaker Endpoint asynchrone: Supprimé (économies)")
             print("\nPour relancer: python3 manage_project.py resume")
             
         except Exception as e:
             print(f"Erreur lors de la mise en pause: {str(e)}")
 
-    def resume(self):
-        """Relance les ressources (recrée l'endpoint SageMaker)"""
-        print("RELANCE DU PROJET")
+    def resume(self, async_inference=False):
+        """Relance les ressources (recrée l'endpoint SageMaker, synchrone ou asynchrone)"""
+        print("RELANCE DU PROJET" + (" (INFÉRENCE ASYNCHRONE)" if async_inference else ""))
         print("=" * 40)
         
         try:
@@ -166,48 +340,70 @@ class ProjectManager:
                 print("   Veuillez d'abord déployer le modèle avec: python3 deploy.py")
                 return
             
-            # Créer la configuration d'endpoint (nom court pour éviter les limites)
-            endpoint_config_name = f"bankruptcy-config-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-            print(f"Création de la configuration d'endpoint: {endpoint_config_name}")
-            
-            self.sagemaker_client.create_endpoint_config(
-                EndpointConfigName=endpoint_config_name,
-                ProductionVariants=[{
-                    'VariantName': 'AllTraffic',
-                    'ModelName': model_name,
-                    'InitialInstanceCount': 1,
-                    'InstanceType': 'ml.t2.medium'
-                }]
-            )
-            print("Configuration d'endpoint créée")
-            
-            # Créer l'endpoint avec un nom unique
-            endpoint_name = f"bankruptcy-predictor-optimized-compatible-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
-            print(f"Création de l'endpoint: {endpoint_name}")
-            self.sagemaker_client.create_endpoint(
-                EndpointName=endpoint_name,
-                EndpointConfigName=endpoint_config_name
-            )
-            print("Endpoint créé")
-            print("Attente de la disponibilité de l'endpoint...")
-            
-            # Attendre que l'endpoint soit prêt
-            waiter = self.sagemaker_client.get_waiter('endpoint_in_service')
-            waiter.wait(EndpointName=endpoint_name)
-            
-            # Sauvegarder le nom de l'endpoint
-            self.save_endpoint_name(endpoint_name)
+            # Endpoint déjà en service (relance répétée) : rien à recréer
+            endpoint_name = self.find_running_endpoint(async_inference)
+            if endpoint_name:
+                print(f"Endpoint déjà en service: {endpoint_name} (création ignorée)")
+            else:
+                # Réutiliser une configuration d'endpoint récente et inutilisée
+                # (évite d'en créer une nouvelle à chaque tentative)
+                endpoint_config_name = self.find_reusable_endpoint_config(model_name, async_inference)
+                if endpoint_config_name:
+                    print(f"Réutilisation de la configuration d'endpoint: {endpoint_config_name}")
+                else:
+                    # Créer la configuration d'endpoint (nom court pour éviter les limites,
+                    # avec le modèle et le mode pour la retrouver lors d'une nouvelle tentative)
+                    endpoint_config_name = f"{endpoint_config_prefix(model_name, async_inference)}{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+                    print(f"Création de la configuration d'endpoint: {endpoint_config_name}")
+                    
+                    endpoint_config = {
+                        'EndpointConfigName': endpoint_config_name,
+                        'ProductionVariants': [{
+                            'VariantName': 'AllTraffic',
+                            'ModelName': model_name,
+                            'InitialInstanceCount': 1,
+                            'InstanceType': 'ml.t2.medium'
+                        }]
+                    }
+                    if async_inference:
+                        # Requêtes mises en file via S3, résultats écrits sous ASYNC_OUTPUT_S3
+                        _, output_s3 = get_async_s3_paths()
+                        endpoint_config['AsyncInferenceConfig'] = {
+                            'OutputConfig': {'S3OutputPath': output_s3},
+                            'ClientConfig': {'MaxConcurrentInvocationsPerInstance': ASYNC_MAX_CONCURRENT_INVOCATIONS}
+                        }
+                    
+                    self.sagemaker_client.create_endpoint_config(**endpoint_config)
+                    print("Configuration d'endpoint créée")
+                
+                # Créer l'endpoint avec un nom unique
+                name_prefix = 'bankruptcy-predictor-optimized-compatible-async' if async_inference else 'bankruptcy-predictor-optimized-compatible'
+                endpoint_name = f"{name_prefix}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+                print(f"Création de l'endpoint: {endpoint_name}")
+                self.sagemaker_client.create_endpoint(
+                    EndpointName=endpoint_name,
+                    EndpointConfigName=endpoint_config_name
+                )
+                print("Endpoint créé")
+                print("Attente de la disponibilité de l'endpoint...")
+                
+                # Attendre que l'endpoint soit prêt
+                waiter = self.sagemaker_client.get_waiter('endpoint_in_service')
+                waiter.wait(EndpointName=endpoint_name)
             
-            # Mettre à jour la Lambda function avec le nouveau endpoint
+            # Sauvegarder le nom de l'endpoint et mettre à jour la Lambda function
             print("Mise à jour de la Lambda function...")
-            self.lambda_client.update_function_configuration(
-                FunctionName=self.lambda_function,
-                Environment={
-                    'Variables': {
-                        'SAGEMAKER_ENDPOINT_NAME': endpoint_name
-                    }
-                }
-            )
+            if async_inference:
+                with open(ASYNC_ENDPOINT_FILE, 'w') as f:
+                    f.write(endpoint_name)
+                input_s3, _ = get_async_s3_paths()
+                self.update_lambda_environment(
+                    SAGEMAKER_ASYNC_ENDPOINT_NAME=endpoint_name,
+                    ASYNC_INPUT_S3=input_s3
+                )
+            else:
+                self.save_endpoint_name(endpoint_name)
+                self.update_lambda_environment(SAGEMAKER_ENDPOINT_NAME=endpoint_name)
             print("Lambda function mise à jour")
             
             print("\nPROJET RELANCÉ")
@@ -220,50 +416,117 @@ class ProjectManager:
         except Exception as e:
             print(f"Erreur lors de la relance: {str(e)}")
 
-    def test(self):
-        """Teste l'API déployée"""
+    def test(self, async_inference=False, direct=False):
+        """Teste l'API déployée (ou directement la Lambda, ou l'endpoint asynchrone)"""
+        if async_inference:
+            return self.test_async()
+        
         print("TEST DE L'API")
         print("=" * 30)
         
         try:
-            import requests
-            
             # Données de test
             test_data = {
                 "data": [0.1] * 50  # 50 features avec valeur 0.1
             }
             
-            print(f"Test de l'API: {self.api_url}")
-            response = requests.post(
-                self.api_url,
-                json=test_data,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
+            if direct:
+                # Invocation directe de la Lambda (sans passer par API Gateway)
+                print(f"Test direct de la Lambda: {self.lambda_function}")
+                response = self.lambda_client.invoke(
+                    FunctionName=self.lambda_function,
+                    Payload=json.dumps({'body': json.dumps(test_data)}).encode()
+                )
+                proxy_response = json.loads(response['Payload'].read())
+                status_code = proxy_response.get('statusCode')
+                body = proxy_response.get('body', '')
+            else:
+                print(f"Test de l'API: {self.api_url}")
+                response = _http.request(
+                    'POST',
+                    self.api_url,
+                    body=json.dumps(test_data).encode(),
+                    headers={'Content-Type': 'application/json'},
+                    timeout=30
+                )
+                status_code = response.status
+                body = response.data.decode()
             
-            if response.status_code == 200:
-                result = response.json()
+            if status_code == 200:
+                result = json.loads(body)
                 print("API fonctionnelle")
                 print(f"   Prédiction: {result.get('prediction')}")
                 print(f"   Probabilité: {result.get('probability')}")
                 print(f"   Niveau de risque: {result.get('risk_level')}")
             else:
-                print(f"Erreur API: {response.status_code}")
-                print(f"   Réponse: {response.text}")
+                print(f"Erreur API: {status_code}")
+                print(f"   Réponse: {body}")
                 
         except Exception as e:
             print(f"Erreur lors du test: {str(e)}")
 
+    def test_async(self, timeout=300):
+        """Teste l'endpoint asynchrone : dépôt de l'entrée sur S3, invocation, attente du résultat"""
+        print("TEST DE L'INFÉRENCE ASYNCHRONE")
+        print("=" * 30)
+        
+        if not self.async_endpoint:
+            print("Aucun endpoint asynchrone trouvé")
+            print("   Utilisez 'python3 manage_project.py resume_async' pour en créer un")
+            return
+        
+        try:
+            # Déposer les données de test sur S3
+            input_s3, _ = get_async_s3_paths()
+            input_location = f"{input_s3}/test-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+            bucket, key = split_s3_uri(input_location)
+            self.s3_client.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=json.dumps([0.1] * 50).encode(),
+                ContentType='application/json'
+            )
+            
+            print(f"Test de l'endpoint asynchrone: {self.async_endpoint}")
+            response = self.sagemaker_runtime.invoke_endpoint_async(
+                EndpointName=self.async_endpoint,
+                ContentType='application/json',
+                InputLocation=input_location
+            )
+            output_location = response['OutputLocation']
+            print(f"   Requête en file: {response['InferenceId']}")
+            print(f"   Résultat attendu dans: {output_location}")
+            
+            # Attendre que le résultat soit écrit sur S3
+            bucket, key = split_s3_uri(output_location)
+            waiter = self.s3_client.get_waiter('object_exists')
+            waiter.wait(Bucket=bucket, Key=key, WaiterConfig={'Delay': 2, 'MaxAttempts': timeout // 2})
+            
+            result = json.loads(self.s3_client.get_object(Bucket=bucket, Key=key)['Body'].read())
+            print("Endpoint asynchrone fonctionnel")
+            print(f"   Prédiction: {result.get('prediction')}")
+            print(f"   Probabilité: {result.get('probability')}")
+            print(f"   Niveau de risque: {result.get('risk_level')}")
+            
+        except Exception as e:
+            print(f"Erreur lors du test asynchrone: {str(e)}")
+
 def main():
     parser = argparse.ArgumentParser(description='Gestionnaire du projet Bankruptcy Prediction')
-    parser.add_argument('action', choices=['status', 'pause', 'resume', 'test'], 
+    parser.add_argument('action', choices=['status', 'pause', 'resume', 'resume_async', 'test'], 
                        help='Action à effectuer')
     parser.add_argument('--region', default='eu-west-3', 
                        help='Région AWS (défaut: eu-west-3)')
+    parser.add_argument('--refresh', action='store_true',
+                       help="Revérifier l'endpoint auprès de SageMaker même si le fichier .endpoint_name est récent")
+    parser.add_argument('--async', dest='async_inference', action='store_true',
+                       help="Tester l'endpoint d'inférence asynchrone (entrée/sortie via S3) au lieu de l'API")
+    parser.add_argument('--direct', action='store_true',
+                       help="Tester en invoquant directement la Lambda (sans API Gateway)")
     
     args = parser.parse_args()
     
-    manager = ProjectManager(region=args.region)
+    manager = ProjectManager(region=args.region, refresh=args.refresh)
     
     if args.action == 'status':
         manager.status()
@@ -271,8 +534,10 @@ def main():
         manager.pause()
     elif args.action == 'resume':
         manager.resume()
+    elif args.action == 'resume_async':
+        manager.resume(async_inference=True)
     elif args.action == 'test':
-        manager.test()
+        manager.test(async_inference=args.async_inference, direct=args.direct)
 
 if __name__ == "__main__":
     main()
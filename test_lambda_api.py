@@ -1,8 +1,69 @@
-import requests
+import urllib3
 import json
 import numpy as np
 import argparse
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Sérialisation JSON rapide si orjson est installé
+try:
+    import orjson
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps(obj):
+        return json.dumps(obj).encode()
+    json_loads = json.loads
+
+# Pool de connexions partagé : les connexions TCP/TLS sont réutilisées entre les requêtes
+_http = urllib3.PoolManager(maxsize=16)
+
+# Nombre de requêtes envoyées en parallèle
+MAX_WORKERS = 4
+
+HEADERS = {
+    'Content-Type': 'application/json'
+}
+
+# Cas de test par défaut (50 features chacun), construits une seule fois à l'import
+_DEFAULT_CASES = [
+    {
+        "name": "Données simples",
+        "data": [0.1] * 50
+    },
+    {
+        "name": "Entreprise saine",
+        "data": [
+            0.15, 0.12, 0.18, 0.20, 0.16, 0.14, 0.17, 0.19, 0.13, 0.15,
+            0.11, 0.16, 0.18, 0.14, 0.12, 0.17, 0.19, 0.15, 0.13, 0.16,
+            0.18, 0.14, 0.12, 0.17, 0.19, 0.15, 0.13, 0.16, 0.18, 0.14,
+            0.12, 0.17, 0.19, 0.15, 0.13, 0.16, 0.18, 0.14, 0.12, 0.17,
+            0.19, 0.15, 0.13, 0.16, 0.18, 0.14, 0.12, 0.17, 0.19, 0.15
+        ]
+    },
+    {
+        "name": "Entreprise à risque",
+        "data": [
+            -0.20, -0.15, -0.18, -0.12, -0.08, -0.15, -0.10, -0.05, -0.12, -0.08,
+            -0.06, -0.14, -0.09, -0.04, -0.11, -0.07, -0.05, -0.13, -0.08, -0.03,
+            -0.10, -0.06, -0.04, -0.12, -0.07, -0.03, -0.09, -0.05, -0.02, -0.08,
+            -0.04, -0.01, -0.07, -0.03, -0.01, -0.06, -0.02, -0.01, -0.05, -0.01,
+            -0.01, -0.04, -0.01, -0.01, -0.03, -0.01, -0.01, -0.02, -0.01, -0.01
+        ]
+    },
+    {
+        "name": "Données aléatoires",
+        "data": np.random.randn(50).tolist()
+    }
+]
+
+# Payloads pré-sérialisés : les tests répétés ne mesurent que le réseau et l'API
+_PAYLOADS = [json_dumps({"data": case['data']}) for case in _DEFAULT_CASES]
+_BATCH_PAYLOAD = json_dumps({"data": [case['data'] for case in _DEFAULT_CASES]})
+
+def get_default_test_cases():
+    """Cas de test par défaut (50 features chacun)"""
+    return _DEFAULT_CASES
 
 def test_lambda_api(api_url, test_cases=None):
     """Teste l'API Lambda"""
@@ -11,113 +72,90 @@ def test_lambda_api(api_url, test_cases=None):
     print("=" * 60)
     
     if test_cases is None:
-        test_cases = [
-            {
-                "name": "Données simples",
-                "data": [0.1] * 50
-            },
-            {
-                "name": "Entreprise saine",
-                "data": [
-                    0.15, 0.12, 0.18, 0.20, 0.16, 0.14, 0.17, 0.19, 0.13, 0.15,
-                    0.11, 0.16, 0.18, 0.14, 0.12, 0.17, 0.19, 0.15, 0.13, 0.16,
-                    0.18, 0.14, 0.12, 0.17, 0.19, 0.15, 0.13, 0.16, 0.18, 0.14,
-                    0.12, 0.17, 0.19, 0.15, 0.13, 0.16, 0.18, 0.14, 0.12, 0.17,
-                    0.19, 0.15, 0.13, 0.16, 0.18, 0.14, 0.12, 0.17, 0.19, 0.15
-                ]
-            },
-            {
-                "name": "Entreprise à risque",
-                "data": [
-                    -0.20, -0.15, -0.18, -0.12, -0.08, -0.15, -0.10, -0.05, -0.12, -0.08,
-                    -0.06, -0.14, -0.09, -0.04, -0.11, -0.07, -0.05, -0.13, -0.08, -0.03,
-                    -0.10, -0.06, -0.04, -0.12, -0.07, -0.03, -0.09, -0.05, -0.02, -0.08,
-                    -0.04, -0.01, -0.07, -0.03, -0.01, -0.06, -0.02, -0.01, -0.05, -0.01,
-                    -0.01, -0.04, -0.01, -0.01, -0.03, -0.01, -0.01, -0.02, -0.01, -0.01
-                ]
-            },
-            {
-                "name": "Données aléatoires",
-                "data": list(np.random.randn(50))
-            }
-        ]
-    
-    headers = {
-        'Content-Type': 'application/json'
-    }
-    
-    results = []
+        test_cases = get_default_test_cases()
+        payloads = _PAYLOADS
+    else:
+        payloads = [json_dumps({"data": test_case['data']}) for test_case in test_cases]
     
-    for i, test_case in enumerate(test_cases, 1):
-        print(f"\n{i}️⃣ Test: {test_case['name']}")
-        print("-" * 40)
-        
-        payload = {
-            "data": test_case['data']
-        }
+    def _send(i):
+        """Envoie un cas de test et retourne son résultat"""
+        test_case = test_cases[i]
         
         try:
             # Mesurer le temps de réponse
             start_time = time.time()
             
-            response = requests.post(
+            response = _http.request(
+                'POST',
                 api_url,
-                headers=headers,
-                json=payload,
+                body=payloads[i],
+                headers=HEADERS,
                 timeout=30
             )
             
             end_time = time.time()
             response_time = end_time - start_time
             
-            if response.status_code == 200:
-                result = response.json()
-                print(f"Succès! Temps de réponse: {response_time:.2f}s")
-                print(f"Prédiction: {result['prediction']}")
-                print(f"Probabilité: {result['probability']}")
-                print(f"Niveau de risque: {result['risk_level']}")
-                print(f"Confiance: {result['confidence']:.4f}")
-                
-                results.append({
+            if response.status == 200:
+                result = json_loads(response.data)
+                return {
                     'test': test_case['name'],
                     'success': True,
                     'response_time': response_time,
                     'prediction': result['prediction'],
+                    'probability': result['probability'],
                     'risk_level': result['risk_level'],
                     'confidence': result['confidence']
-                })
+                }
             else:
-                print(f"Erreur HTTP {response.status_code}")
-                print(f"Réponse: {response.text}")
-                
-                results.append({
+                return {
                     'test': test_case['name'],
                     'success': False,
-                    'error': f"HTTP {response.status_code}",
-                    'response': response.text
-                })
+                    'error': f"HTTP {response.status}",
+                    'response': response.data.decode()
+                }
                 
-        except requests.exceptions.Timeout:
-            print("Timeout de la requête")
-            results.append({
+        except urllib3.exceptions.TimeoutError:
+            return {
                 'test': test_case['name'],
                 'success': False,
                 'error': 'Timeout'
-            })
-        except requests.exceptions.RequestException as e:
-            print(f"Erreur de requête: {str(e)}")
-            results.append({
+            }
+        except urllib3.exceptions.HTTPError as e:
+            return {
                 'test': test_case['name'],
                 'success': False,
-                'error': str(e)
-            })
+                'error': f"Erreur de requête: {str(e)}"
+            }
         except Exception as e:
-            print(f"Erreur inattendue: {str(e)}")
-            results.append({
+            return {
                 'test': test_case['name'],
                 'success': False,
-                'error': str(e)
-            })
+                'error': f"Erreur inattendue: {str(e)}"
+            }
+    
+    # Envoyer les cas en parallèle sur le pool de connexions partagé
+    results = [None] * len(test_cases)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(_send, i): i for i in range(len(test_cases))}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    
+    # Afficher les résultats dans l'ordre des cas de test
+    for i, result in enumerate(results, 1):
+        print(f"\n{i}️⃣ Test: {result['test']}")
+        print("-" * 40)
+        
+        if result['success']:
+            print(f"Succès! Temps de réponse: {result['response_time']:.2f}s")
+            print(f"Prédiction: {result['prediction']}")
+            print(f"Probabilité: {result['probability']}")
+            print(f"Niveau de risque: {result['risk_level']}")
+            print(f"Confiance: {result['confidence']:.4f}")
+        else:
+            print(f"Erreur: {result['error']}")
+            if 'response' in result:
+                print(f"Réponse: {result['response']}")
     
     # Résumé des tests
     print("\n" + "=" * 60)
@@ -147,15 +185,53 @@ def test_lambda_api(api_url, test_cases=None):
     
     return len(failed_tests) == 0
 
+def test_lambda_api_batch(api_url, test_cases=None):
+    """Teste l'API en mode batch : tous les cas en une seule requête"""
+    
+    print(f"\nTEST BATCH DE L'API LAMBDA: {api_url}")
+    print("=" * 60)
+    
+    if test_cases is None:
+        test_cases = get_default_test_cases()
+        payload = _BATCH_PAYLOAD
+    else:
+        payload = json_dumps({"data": [test_case['data'] for test_case in test_cases]})
+    
+    try:
+        start_time = time.time()
+        response = _http.request(
+            'POST',
+            api_url,
+            body=payload,
+            headers=HEADERS,
+            timeout=30
+        )
+        response_time = time.time() - start_time
+        
+        if response.status != 200:
+            print(f"Erreur HTTP {response.status}")
+            print(f"Réponse: {response.data.decode()}")
+            return False
+        
+        result = json_loads(response.data)
+        print(f"Succès! {len(test_cases)} prédictions en {response_time:.2f}s")
+        for test_case, prediction, risk_level in zip(test_cases, result['prediction'], result['risk_level']):
+            print(f"  - {test_case['name']}: prédiction {prediction}, risque {risk_level}")
+        return True
+        
+    except Exception as e:
+        print(f"Erreur lors du test batch: {str(e)}")
+        return False
+
 def test_cors(api_url):
     """Teste les en-têtes CORS"""
     print(f"\nTest des en-têtes CORS...")
     
     try:
         # Test OPTIONS
-        response = requests.options(api_url, timeout=10)
+        response = _http.request('OPTIONS', api_url, timeout=10)
         
-        if response.status_code == 200:
+        if response.status == 200:
             print("Méthode OPTIONS fonctionne")
             
             cors_headers = {
@@ -167,7 +243,7 @@ def test_cors(api_url):
             print(f"En-têtes CORS: {cors_headers}")
             return True
         else:
-            print(f"Méthode OPTIONS échouée: {response.status_code}")
+            print(f"Méthode OPTIONS échouée: {response.status}")
             return False
             
     except Exception as e:
@@ -179,12 +255,18 @@ def main():
     parser = argparse.ArgumentParser(description='Tester l\'API Lambda + API Gateway')
     parser.add_argument('--api-url', type=str, required=True, help='URL de l\'API Gateway')
     parser.add_argument('--test-cors', action='store_true', help='Tester les en-têtes CORS')
+    parser.add_argument('--batch', action='store_true', help='Tester aussi le mode batch (tous les cas en une requête)')
     
     args = parser.parse_args()
     
     # Test principal
     success = test_lambda_api(args.api_url)
     
+    # Test batch si demandé
+    if args.batch:
+        batch_success = test_lambda_api_batch(args.api_url)
+        success = success and batch_success
+    
     # Test CORS si demandé
     if args.test_cors:
         cors_success = test_cors(args.api_url)
@@ -1,155 +1,395 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import StratifiedKFold, StratifiedShuffleSplit
 from sklearn.neural_network import MLPClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import classification_report, confusion_matrix, roc_auc_score, roc_curve
-from sklearn.feature_selection import SelectKBest, f_classif
+from sklearn.feature_selection import SelectKBest
+from scipy.special import fdtrc
+from sklearn.neighbors import NearestNeighbors
+from sklearn.utils import resample
 from imblearn.combine import SMOTETomek
+from imblearn.over_sampling import SMOTE
+from imblearn.under_sampling import TomekLinks
+from threadpoolctl import threadpool_limits
 import joblib
+from joblib import Parallel, delayed
+import argparse
+import functools
+import hashlib
+import io
+import json
 import os
+import tarfile
+import time
+
+# Lecture CSV multi-threadée via Arrow si pyarrow est installé, sinon parseur C de pandas
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
+DATA_FILE = 'data.csv'
+TARGET_COLUMN = 'Bankrupt?'
+
+# Cache des entraînements successifs (features sélectionnées et données équilibrées)
+CACHE_DIR = 'cache'
+
+# Nombre de features conservées par SelectKBest
+N_FEATURES = 50
+
+# Type des features pendant tout l'entraînement : float32 divise par deux la mémoire
+# et double le débit des produits matriciels BLAS (sgemm) par rapport au float64
+FEATURE_DTYPE = np.float32
+
+# Cœurs réellement utilisables par ce processus : joblib.cpu_count tient compte de
+# l'affinité CPU et des quotas cgroups (conteneurs), contrairement à os.cpu_count
+AVAILABLE_CPUS = joblib.cpu_count()
+
+# Threads BLAS fixés par l'utilisateur (OMP_NUM_THREADS / MKL_NUM_THREADS /
+# OPENBLAS_NUM_THREADS) : la validation croisée ne les plafonne pas alors par fold
+USER_THREAD_LIMIT = any(os.environ.get(var) for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'))
+
+# Artefacts d'entraînement regroupés dans une seule archive gzip (un fichier, un upload) :
+# le modèle en pickle protocole 5 (la compression est celle de l'archive), les features
+# et les métriques en JSON (lisibles sans désérialiser de pickle). L'archive n'est relue
+# qu'une fois par deploy.py, qui reconstruit lui-même un bundle non compressé (mmap).
+BUNDLE_PATH = 'models/bundle.tar.gz'
+DUMP_OPTIONS = {'protocol': 5}
+
+def add_bytes_to_tar(tar, arcname, data):
+    """Ajoute un contenu en mémoire à l'archive"""
+    info = tarfile.TarInfo(arcname)
+    info.size = len(data)
+    info.mtime = time.time()
+    tar.addfile(info, io.BytesIO(data))
+
+@functools.lru_cache(maxsize=1)
+def data_fingerprint(path=DATA_FILE):
+    """Empreinte courte du contenu de data.csv (clé des caches de features et d'équilibrage)"""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:8]
+
+def cache_prefix(stage, k):
+    """Préfixe des fichiers de cache d'une étape (clé : contenu de data.csv, k et type des features)"""
+    return os.path.join(CACHE_DIR, f'{stage}_{data_fingerprint()}_k{k}_{np.dtype(FEATURE_DTYPE).name}')
+
+def save_cached_arrays(prefix, **arrays):
+    """Sauvegarde chaque tableau dans son propre fichier .npy (relisible en mmap)"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(f'{prefix}_{name}.npy', np.asarray(array))
+
+def load_cached_arrays(prefix, *names):
+    """Ouvre les tableaux en cache en mmap (lecture seule, rien n'est copié en RAM), None si absents"""
+    paths = [f'{prefix}_{name}.npy' for name in names]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    return [np.load(path, mmap_mode='r') for path in paths]
+
+def load_selected_features(k=N_FEATURES):
+    """Données après sélection des features si déjà en cache : (X_selected, y, features) ou None"""
+    cached = load_cached_arrays(cache_prefix('selected', k), 'X', 'y', 'features')
+    if cached is None:
+        return None
+    X_selected, y, features = cached
+    return X_selected, y, features.tolist()
 
 def load_and_prepare_data():
     print("Chargement des données...")
     
-    # Charger les données
-    df = pd.read_csv('data.csv')
+    # Charger les données (appelé seulement quand le cache .npy, clé md5 de data.csv, manque)
+    df = pd.read_csv(DATA_FILE, engine=CSV_ENGINE)
     
-    # Séparer les features et la target
-    X = df.drop('Bankrupt?', axis=1)
-    y = df['Bankrupt?']
+    # Séparer les features et la target (pop retire la colonne sans recopier le reste)
+    y = df.pop(TARGET_COLUMN)
+    X = df.astype(FEATURE_DTYPE, copy=False)
     
     print(f"Données chargées: {X.shape[0]} échantillons, {X.shape[1]} features")
-    print(f"Distribution des classes: {y.value_counts().to_dict()}")
+    # Target binaire 0/1 : histogramme numpy en une passe
+    counts = np.bincount(y.to_numpy())
+    print(f"Distribution des classes: {dict(enumerate(counts.tolist()))}")
     
     return X, y
 
-def optimize_features(X, y):
+def f_classif_fast(X, y):
+    """
+    ANOVA F (mêmes scores et p-values que sklearn f_classif) calculée pour toutes
+    les features en une passe : les sommes par classe sont un seul produit matriciel
+    """
+    X = np.asarray(X, dtype=np.float64)
+    classes, y_idx = np.unique(np.asarray(y), return_inverse=True)
+    n_samples, n_classes = X.shape[0], len(classes)
+    
+    # Indicatrices des classes (n_classes, n_samples) : sommes par classe = one_hot @ X
+    one_hot = np.zeros((n_classes, n_samples))
+    one_hot[y_idx, np.arange(n_samples)] = 1.0
+    class_sums = one_hot @ X
+    class_counts = one_hot.sum(axis=1)
+    
+    total_sum = X.sum(axis=0)
+    correction = total_sum ** 2 / n_samples
+    ss_total = np.einsum('ij,ij->j', X, X) - correction
+    ss_between = (class_sums ** 2 / class_counts[:, None]).sum(axis=0) - correction
+    ss_within = ss_total - ss_between
+    
+    df_between = n_classes - 1
+    df_within = n_samples - n_classes
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f_scores = (ss_between / df_between) / (ss_within / df_within)
+    p_values = fdtrc(df_between, df_within, f_scores)
+    return f_scores, p_values
+
+def optimize_features(X, y, k=N_FEATURES):
     print("Optimisation des features...")
     
     # Sélection des meilleures features
-    selector = SelectKBest(score_func=f_classif, k=50)  # Garder 50 meilleures features
+    selector = SelectKBest(score_func=f_classif_fast, k=k)  # Garder les k meilleures features
     X_selected = selector.fit_transform(X, y)
     
     # Récupérer les noms des features sélectionnées
     selected_features = X.columns[selector.get_support()].tolist()
     
+    # Mise en cache pour les entraînements suivants (voir load_selected_features)
+    save_cached_arrays(cache_prefix('selected', k), X=X_selected, y=y, features=np.array(selected_features))
+    
     print(f"Features sélectionnées: {len(selected_features)}")
     print(f"Features: {selected_features[:10]}...")  # Afficher les 10 premières
     
     return X_selected, selected_features
 
-def balance_data(X, y):
+def subsample_majority(X, y, majority_ratio):
+    """Sous-échantillonne (sans remise) la classe majoritaire à majority_ratio fois l'effectif de la minoritaire"""
+    counts = np.bincount(y)
+    minority, majority = np.argmin(counts), np.argmax(counts)
+    n_keep = int(counts[minority] * majority_ratio)
+    if n_keep >= counts[majority]:
+        return X, y
+    
+    majority_idx = resample(np.flatnonzero(y == majority), replace=False, n_samples=n_keep, random_state=42)
+    keep = np.sort(np.concatenate([majority_idx, np.flatnonzero(y != majority)]))
+    return X[keep], y[keep]
+
+def balance_data(X, y, majority_ratio=None):
     print("Équilibrage des données...")
     
-    # Appliquer SMOTE-Tomek
-    smote_tomek = SMOTETomek(random_state=42)
+    # SMOTE-Tomek est l'étape la plus coûteuse : résultat mis en cache pour ces données
+    stage = 'balanced' if majority_ratio is None else f'balanced_r{majority_ratio:g}'
+    prefix = cache_prefix(stage, X.shape[1])
+    cached = load_cached_arrays(prefix, 'X', 'y')
+    if cached is not None:
+        X_balanced, y_balanced = cached
+        print(f"Données équilibrées (cache): {X_balanced.shape[0]} échantillons")
+        return X_balanced, y_balanced
+    
+    # SMOTE a besoin de tableaux en mémoire : les données mappées depuis le cache sont chargées ici
+    X, y = np.array(X), np.array(y)
+    
+    # Option : réduire la classe majoritaire avant SMOTE-Tomek (coût des plus proches voisins)
+    if majority_ratio is not None:
+        X, y = subsample_majority(X, y, majority_ratio)
+        print(f"Sous-échantillonnage de la classe majoritaire: {X.shape[0]} échantillons avant SMOTE-Tomek")
+    
+    # Appliquer SMOTE-Tomek (mêmes paramètres que par défaut, mais les recherches
+    # de plus proches voisins utilisent tous les cœurs)
+    smote_tomek = SMOTETomek(
+        random_state=42,
+        smote=SMOTE(random_state=42, k_neighbors=NearestNeighbors(n_neighbors=6, n_jobs=-1)),
+        tomek=TomekLinks(sampling_strategy='all', n_jobs=-1)
+    )
     X_balanced, y_balanced = smote_tomek.fit_resample(X, y)
     
+    save_cached_arrays(prefix, X=X_balanced, y=y_balanced)
+    
     print(f"Données équilibrées: {X_balanced.shape[0]} échantillons")
     print(f"Nouvelle distribution: {np.bincount(y_balanced)}")
     
     return X_balanced, y_balanced
 
-def train_mlp_model(X, y):
-    print("Entraînement du modèle MLPClassifier optimisé...")
-    
-    # Diviser les données
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
-    )
-    
-    # Normaliser les données
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-    
-    # Entraîner le modèle MLPClassifier avec des paramètres optimisés
-    mlp = MLPClassifier(
+def build_mlp():
+    """MLPClassifier avec les paramètres optimisés"""
+    return MLPClassifier(
         hidden_layer_sizes=(100, 50),  # Architecture optimisée
         activation='relu',
         solver='adam',
         alpha=0.001,  # Régularisation L2
-        batch_size='auto',
+        batch_size=1024,  # Grands mini-batchs : chaque itération est un GEMM qui occupe le BLAS
         learning_rate='adaptive',
-        learning_rate_init=0.001,
+        learning_rate_init=0.005,  # Pas augmenté en proportion de la taille des batchs
         max_iter=1000,
         random_state=42,
         early_stopping=True,
         validation_fraction=0.1,
         n_iter_no_change=10
     )
+
+def fit_one(X_train, y_train, X_test, y_test, n_threads=None):
+    """
+    Normalise, entraîne et évalue un MLP sur une séparation train/test.
+    Retourne (auc_score, mlp, scaler, X_test_scaled, y_pred_proba)
+    """
+    # Normaliser les données en place : X_train et X_test sont déjà des copies
+    # (indexation par les indices du découpage), inutile d'allouer une seconde version normalisée.
+    # Exception : dans un worker joblib, les gros tableaux arrivent en memmap lecture seule
+    if not X_train.flags.writeable:
+        X_train = X_train.copy()
+    if not X_test.flags.writeable:
+        X_test = X_test.copy()
+    scaler = StandardScaler(copy=False).fit(X_train)
+    X_train_scaled = scaler.transform(X_train, copy=False)
+    X_test_scaled = scaler.transform(X_test, copy=False)
     
     # Entraîner le modèle
-    mlp.fit(X_train_scaled, y_train)
+    mlp = build_mlp()
+    # n_threads : plafond des threads BLAS (folds de validation croisée), None : défaut de la bibliothèque
+    with threadpool_limits(limits=n_threads, user_api='blas'):
+        mlp.fit(X_train_scaled, y_train)
     
     # Prédictions
-    y_pred = mlp.predict(X_test_scaled)
     y_pred_proba = mlp.predict_proba(X_test_scaled)[:, 1]
     
     # Métriques
     auc_score = roc_auc_score(y_test, y_pred_proba)
     
+    return auc_score, mlp, scaler, X_test_scaled, y_pred_proba
+
+def train_mlp_model(X, y):
+    print("Entraînement du modèle MLPClassifier optimisé...")
+    
+    # Diviser les données : indices stratifiés (même découpage que train_test_split),
+    # chaque partie est extraite une seule fois du tableau équilibré (éventuellement mappé)
+    X, y = np.asarray(X), np.asarray(y)
+    splitter = StratifiedShuffleSplit(n_splits=1, test_size=0.2, random_state=42)
+    train_idx, test_idx = next(splitter.split(X, y))
+    X_train, X_test = X[train_idx], X[test_idx]
+    y_train, y_test = y[train_idx], y[test_idx]
+    
+    # Entraîner le modèle MLPClassifier avec des paramètres optimisés
+    auc_score, mlp, scaler, X_test_scaled, y_pred_proba = fit_one(X_train, y_train, X_test, y_test)
+    
+    # Accuracy déduite des probabilités déjà calculées (pas de nouvelle passe forward) ;
+    # même règle que predict : classe 1 si sa probabilité dépasse strictement 0.5
+    y_pred = (y_pred_proba > 0.5).astype(np.int8)
+    accuracy = (y_pred == y_test).mean()
+    
     print(f"Modèle entraîné avec succès!")
+    print(f"Précision des poids: {mlp.coefs_[0].dtype}")
     print(f"ROC-AUC Score: {auc_score:.4f}")
-    print(f"Accuracy: {mlp.score(X_test_scaled, y_test):.4f}")
+    print(f"Accuracy: {accuracy:.4f}")
     
     return mlp, scaler, auc_score, X_test_scaled, y_test, y_pred_proba
 
-def save_model_and_artifacts(model, scaler, selected_features, auc_score):
-    print("Sauvegarde du modèle et des artefacts...")
+def score_fold(X_train, y_train, X_test, y_test, n_threads):
+    """Entraîne un fold de validation croisée et ne renvoie que son ROC-AUC (rien d'autre à transférer)"""
+    return fit_one(X_train, y_train, X_test, y_test, n_threads)[0]
+
+def cross_validate_model(X, y, n_splits=5, n_jobs=-1):
+    """Validation croisée stratifiée : les folds sont entraînés en parallèle (processus joblib)"""
+    print(f"Validation croisée ({n_splits} folds)...")
     
-    # Créer le dossier models s'il n'existe pas
-    os.makedirs('models', exist_ok=True)
+    X, y = np.asarray(X), np.asarray(y)
+    folds = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=42).split(X, y)
     
-    # Sauvegarder le modèle
-    model_path = 'models/MLPClassifier_optimized.pkl'
-    joblib.dump(model, model_path)
-    print(f"Modèle sauvegardé: {model_path}")
+    # Répartir les cœurs entre les folds pour éviter la sur-souscription des threads BLAS
+    n_workers = min(n_splits, AVAILABLE_CPUS if n_jobs == -1 else n_jobs)
+    threads_per_fold = None if USER_THREAD_LIMIT else max(1, AVAILABLE_CPUS // n_workers)
     
-    # Sauvegarder le scaler
-    scaler_path = 'models/scaler_optimized.pkl'
-    joblib.dump(scaler, scaler_path)
-    print(f"Scaler sauvegardé: {scaler_path}")
+    cv_scores = Parallel(n_jobs=n_workers)(
+        delayed(score_fold)(X[train_idx], y[train_idx], X[test_idx], y[test_idx], threads_per_fold)
+        for train_idx, test_idx in folds
+    )
     
-    # Sauvegarder les features sélectionnées
-    features_path = 'models/selected_features_optimized.pkl'
-    joblib.dump(selected_features, features_path)
-    print(f"Features sauvegardées: {features_path}")
+    print(f"ROC-AUC par fold: {[round(score, 4) for score in cv_scores]}")
+    print(f"ROC-AUC moyen: {np.mean(cv_scores):.4f} (± {np.std(cv_scores):.4f})")
     
-    # Sauvegarder les métriques
+    return cv_scores
+
+def fuse_scaler_into_model(model, scaler):
+    """
+    Fusionne le StandardScaler dans la première couche du MLP : le modèle obtenu
+    prend directement les features brutes (plus de scaler à sauvegarder ni à appliquer)
+    """
+    # ((X - μ) / σ) @ W + b  ==  X @ (W / σ) + (b - μ @ (W / σ))
+    fused_coefs = model.coefs_[0] / scaler.scale_[:, None]
+    model.intercepts_[0] = model.intercepts_[0] - scaler.mean_ @ fused_coefs
+    model.coefs_[0] = fused_coefs
+    
+    # Les statistiques du scaler sont en float64 : revenir à des poids float32 contigus
+    model.coefs_ = [np.ascontiguousarray(w, dtype=FEATURE_DTYPE) for w in model.coefs_]
+    model.intercepts_ = [np.ascontiguousarray(b, dtype=FEATURE_DTYPE) for b in model.intercepts_]
+    
+    # Marqueur vérifié par deploy.py (un modèle non fusionné attend des données normalisées)
+    model.scaler_fused_ = True
+    return model
+
+def save_model_and_artifacts(model, selected_features, auc_score, cv_scores=None):
+    print("Sauvegarde du modèle et des artefacts...")
+    
+    # Créer le dossier models s'il n'existe pas
+    os.makedirs('models', exist_ok=True)
+    
+    # Métriques
     metrics = {
-        'roc_auc': auc_score,
+        'roc_auc': float(auc_score),
         'model_type': 'MLPClassifier',
+        'weights_dtype': str(model.coefs_[0].dtype),
         'n_features': len(selected_features),
         'features': selected_features
     }
-    metrics_path = 'models/model_metrics_optimized.pkl'
-    joblib.dump(metrics, metrics_path)
-    print(f"Métriques sauvegardées: {metrics_path}")
+    if cv_scores is not None:
+        metrics['cv_roc_auc'] = [float(score) for score in cv_scores]
+    
+    # Sauvegarder le modèle, les features sélectionnées et les métriques dans une seule archive
+    model_buffer = io.BytesIO()
+    joblib.dump(model, model_buffer, **DUMP_OPTIONS)
+    with tarfile.open(BUNDLE_PATH, 'w:gz') as tar:
+        add_bytes_to_tar(tar, 'model.pkl', model_buffer.getvalue())
+        add_bytes_to_tar(tar, 'features.json', json.dumps(selected_features).encode())
+        add_bytes_to_tar(tar, 'metrics.json', json.dumps(metrics, indent=2).encode())
+    
+    print(f"Archive sauvegardée: {BUNDLE_PATH} (model.pkl, features.json, metrics.json)")
     
-    return model_path, scaler_path, features_path, metrics_path
+    return BUNDLE_PATH
 
 def main():
+    parser = argparse.ArgumentParser(description="Entraînement du modèle de prédiction de faillite")
+    parser.add_argument('--cv', type=int, default=0, metavar='N_FOLDS',
+                        help='Validation croisée stratifiée en N folds (parallèle) avant l\'entraînement final (défaut: désactivée)')
+    parser.add_argument('--majority-ratio', type=float, default=None, metavar='RATIO',
+                        help='Sous-échantillonner la classe majoritaire à RATIO fois la minoritaire avant SMOTE-Tomek (défaut: désactivé)')
+    args = parser.parse_args()
+    
     print("ENTRAÎNEMENT D'UN MODÈLE COMPATIBLE SAGEMAKER")
     print("=" * 60)
     
     try:
-        # 1. Charger et préparer les données
-        X, y = load_and_prepare_data()
-        
-        # 2. Optimiser les features
-        X_selected, selected_features = optimize_features(X, y)
+        # 1-2. Charger les données et optimiser les features
+        # (entraînement répété : données déjà sélectionnées mappées depuis le cache)
+        cached = load_selected_features()
+        if cached is not None:
+            X_selected, y, selected_features = cached
+            print(f"Données et features chargées depuis le cache: {X_selected.shape[0]} échantillons, {len(selected_features)} features")
+        else:
+            X, y = load_and_prepare_data()
+            X_selected, selected_features = optimize_features(X, y)
         
         # 3. Équilibrer les données
-        X_balanced, y_balanced = balance_data(X_selected, y)
+        X_balanced, y_balanced = balance_data(X_selected, y, majority_ratio=args.majority_ratio)
+        
+        # 3 bis. Validation croisée (optionnelle)
+        cv_scores = cross_validate_model(X_balanced, y_balanced, n_splits=args.cv) if args.cv > 1 else None
         
         # 4. Entraîner le modèle
         model, scaler, auc_score, X_test, y_test, y_pred_proba = train_mlp_model(X_balanced, y_balanced)
         
-        # 5. Sauvegarder les artefacts
-        model_path, scaler_path, features_path, metrics_path = save_model_and_artifacts(
-            model, scaler, selected_features, auc_score
+        # 5. Fusionner le scaler dans le modèle et sauvegarder les artefacts
+        model = fuse_scaler_into_model(model, scaler)
+        bundle_path = save_model_and_artifacts(
+            model, selected_features, auc_score, cv_scores
         )
         
         print("\n" + "=" * 60)
@@ -158,11 +398,7 @@ def main():
         print(f"Modèle: MLPClassifier optimisé")
         print(f"ROC-AUC Score: {auc_score:.4f}")
         print(f"Nombre de features: {len(selected_features)}")
-        print(f"Fichiers créés:")
-        print(f"  - {model_path}")
-        print(f"  - {scaler_path}")
-        print(f"  - {features_path}")
-        print(f"  - {metrics_path}")
+        print(f"Fichier créé: {bundle_path} (modèle avec scaler fusionné, features, métriques)")
         
         return True
         